@@ -0,0 +1,174 @@
+"""@package NMF-visualization
+
+Caculate a batch of NMF transcriptions in parallel.
+
+The manifest is a text file with one job per line:
+
+    excerpt dictionary [norm] [updateW] [destination]
+
+where updateW is "1"/"true" to update the dictionary. Empty lines and lines
+starting with "#" are ignored.
+"""
+
+import argparse
+import numpy as np
+import os
+import tempfile
+import time
+
+from concurrent.futures import ProcessPoolExecutor
+from concurrent.futures import as_completed
+from tabulate import tabulate
+
+from calculateNMF import DICTIONARY_PATH
+from calculateNMF import NMF_PATH
+from calculateNMF import SPECTROGRAM_PATH
+from calculateNMF import calculateTranscription
+from calculateNMF import normalizeSpectrogram
+from calculateNMF import transcribe
+from lib.cache import cachePath
+from lib.cache import saveCache
+from lib.utils import createDir
+from lib.utils import findFile
+
+def readManifest(path):
+    """
+    Read a batch manifest.
+
+    Keyword arguments:
+    path -- the manifest path.
+
+    Returns:
+    jobs -- a list of job dictionaries.
+    """
+
+    jobs = []
+    with open(path, "r") as f:
+        for line in f:
+            line = line.split()
+            if (len(line) == 0 or line[0].startswith("#")):
+                continue
+
+            job = {"excerpt": line[0], "dictionary": line[1], "norm": "max",
+                   "updateW": False, "saveAs": None}
+            if (len(line) > 2):
+                job["norm"] = line[2]
+            if (len(line) > 3):
+                job["updateW"] = line[3].lower() in ["1", "true", "yes"]
+            if (len(line) > 4):
+                job["saveAs"] = line[4]
+            jobs += [job]
+
+    return jobs
+
+def outputPath(job):
+    """
+    Return the destination of a job's transcription.
+
+    Keyword arguments:
+    job -- the job dictionary.
+    """
+
+    if (not job["saveAs"] is None):
+        return job["saveAs"]
+
+    excerpt = os.path.splitext(os.path.basename(job["excerpt"]))[0]
+    dictionary = os.path.splitext(os.path.basename(job["dictionary"]))[0]
+
+    return NMF_PATH + excerpt + "-" + dictionary + "_NMF.npy"
+
+def runJob(job):
+    """
+    Calculate the transcription of a single job.
+
+    The normalized spectrogram is memory mapped read-only, so workers
+    transcribing the same excerpt share its pages.
+
+    Keyword arguments:
+    job -- the job dictionary, with the normalized spectrogram path in
+        "spectrogram".
+
+    Returns:
+    t -- the calculation time in s.
+    """
+
+    start = time.perf_counter()
+
+    V = np.load(job["spectrogram"], mmap_mode = "r")
+    W = np.load(job["dictionaryPath"])
+    H = transcribe(V, W, job["updateW"])
+    saveCache(job["cache"], H)
+
+    path = outputPath(job)
+    createDir(path)
+    np.save(path, H)
+
+    return time.perf_counter() - start
+
+if (__name__ == "__main__"):
+
+    parser = argparse.ArgumentParser("Calculate a batch of NMF "
+                                     + "transcriptions.")
+    parser.add_argument("manifest", help = "The job manifest file.", type = str)
+    parser.add_argument("-j", "--jobs",
+                        help = "The number of worker processes. "
+                        + "(default = number of CPUs)",
+                        type = int, default = os.cpu_count(), dest = "jobs")
+    args = parser.parse_args()
+
+    jobs = readManifest(args.manifest)
+
+    for job in jobs:
+        job["spectrogramPath"] = findFile(job["excerpt"], [SPECTROGRAM_PATH])
+        job["dictionaryPath"] = findFile(job["dictionary"], [DICTIONARY_PATH])
+        if (job["spectrogramPath"] is None
+            or job["dictionaryPath"] is None):
+            print ("Could not load files for %s with %s!"
+                   % (job["excerpt"], job["dictionary"]))
+            raise SystemExit()
+        job["cache"] = cachePath(calculateTranscription,
+                                 [job["spectrogramPath"],
+                                  job["dictionaryPath"]],
+                                 norm = job["norm"].lower(),
+                                 updateW = job["updateW"])
+
+    # Reuse cached transcriptions.
+    table = []
+    for job in list(jobs):
+        if (os.path.isfile(job["cache"])):
+            os.utime(job["cache"])
+            path = outputPath(job)
+            createDir(path)
+            np.save(path, np.load(job["cache"]))
+            print ("Reused cached %s." % path)
+            table += [[job["excerpt"], job["dictionary"], job["norm"],
+                       job["updateW"], path, 0.0]]
+            jobs.remove(job)
+
+    with tempfile.TemporaryDirectory() as tmp:
+
+        # Load and normalize each spectrogram once.
+        shared = {}
+        for job in jobs:
+            key = (job["spectrogramPath"], job["norm"].lower())
+            if (not key in shared):
+                S = np.load(job["spectrogramPath"], mmap_mode = "r")
+                path = os.path.join(tmp, "%d.npy" % len(shared))
+                np.save(path, normalizeSpectrogram(S, job["norm"]))
+                shared[key] = path
+            job["spectrogram"] = shared[key]
+
+        start = time.perf_counter()
+        with ProcessPoolExecutor(max_workers = args.jobs) as executor:
+            futures = {executor.submit(runJob, job): job for job in jobs}
+            for future in as_completed(futures):
+                job = futures[future]
+                t = future.result()
+                print ("Finished %s in %.3g s." % (outputPath(job), t))
+                table += [[job["excerpt"], job["dictionary"], job["norm"],
+                           job["updateW"], outputPath(job), t]]
+
+    headers = ["Excerpt", "Dictionary", "Normalization", "Update W",
+               "Destination", "Time (s)"]
+    print(tabulate(table, headers, tablefmt = "github", floatfmt = ".3g"))
+    print ("Total time %.3g s." % (time.perf_counter() - start))
@@ -0,0 +1,239 @@
+"""@package NMF-visualization
+
+Benchmark the spectrogram, normalization and NMF functions.
+
+Each case is timed on synthetic inputs of configurable size and on the
+bundled excerpts. Throughput is reported in frames per second together
+with the peak memory allocated during a call, and results can be saved
+as JSON and compared to an earlier run.
+"""
+
+import argparse
+import functools
+import json
+import librosa
+import math
+import numpy as np
+import platform
+import time
+import tracemalloc
+
+from tabulate import tabulate
+
+from lib.CQT import CQTspectrogram
+from lib.NMF import NMF
+from lib.NMF import SOLVERS
+from lib.NMF import transcribeInstrument
+from lib.normalize import maxNormalize
+from lib.normalize import RMSnormalize
+from lib.normalize import sumNormalize
+from lib.spectrogram import magnitudeSpectrogram
+
+AUDIO_PATH = "data/audio/"
+DICTIONARY_PATH = "data/dictionaries/"
+EXCERPTS = ["bassoon-solo", "mix"]
+
+def measure(function, numFrames, repeat = 3):
+    """
+    Time a function and measure its peak memory allocation.
+
+    The time is the best of several calls. Memory is traced in a separate
+    call, as tracing slows the function down.
+
+    Keyword arguments:
+    function -- the function to call without arguments.
+    numFrames -- the number of frames processed per call.
+    repeat -- the number of timed calls. (default = 3)
+
+    Returns:
+    result -- a dictionary with the time in s, the throughput in frames
+        per second and the peak memory in MB, or the error raised.
+    """
+
+    try:
+        times = []
+        for i in range(repeat):
+            start = time.perf_counter()
+            function()
+            times += [time.perf_counter() - start]
+
+        tracemalloc.start()
+        function()
+        size, peak = tracemalloc.get_traced_memory()
+        tracemalloc.stop()
+    except Exception as e:
+        if (tracemalloc.is_tracing()):
+            tracemalloc.stop()
+        return {"error": "%s: %s" % (type(e).__name__, e)}
+
+    t = min(times)
+
+    return {"time": t, "fps": numFrames/t, "memory": peak/2**20}
+
+def cases(args):
+    """
+    Return the benchmark cases selected by the filter.
+
+    Case names do not depend on the inputs, so an excerpt is only loaded
+    if one of its cases is selected.
+
+    Keyword arguments:
+    args -- the parsed command line arguments.
+
+    Returns:
+    cases -- a list of (name, function, number of frames) tuples.
+    """
+
+    Fs = 44100
+    hopSize = math.floor(args.hopLen*Fs/1000)
+
+    def synthetic():
+        rng = np.random.default_rng(args.seed)
+        x = rng.standard_normal(2048 + (args.frames - 1)*hopSize)
+        V = rng.random((args.bins, args.frames))
+        W = rng.random((args.bins, args.notes))
+        return x, V, W
+
+    def excerpt(name):
+        x, _ = librosa.load(AUDIO_PATH + name + ".wav", sr = Fs, mono = True)
+        V = maxNormalize(magnitudeSpectrogram(x, Fs), axis = 1)
+        W = np.load(DICTIONARY_PATH + "bassoon.npy")
+        return x, V, W
+
+    signals = [("synthetic", synthetic)]
+    if (not args.synthetic):
+        signals += [(name, functools.partial(excerpt, name))
+                    for name in EXCERPTS]
+
+    # Cases as (name, function of x, V and W, whether to count hops).
+    templates = [
+        ("magnitudeSpectrogram",
+         lambda x, V, W: magnitudeSpectrogram(x, Fs, hopLen = args.hopLen),
+         True),
+        ("CQTspectrogram",
+         lambda x, V, W: CQTspectrogram(x, Fs, hopLen = args.hopLen),
+         True),
+        ("maxNormalize", lambda x, V, W: maxNormalize(V, axis = 1), False),
+        ("sumNormalize", lambda x, V, W: sumNormalize(V, axis = 1), False),
+        ("RMSnormalize", lambda x, V, W: RMSnormalize(V, axis = 1), False),
+        ("NMF",
+         lambda x, V, W: NMF(V, W = W, k = W.shape[1],
+                             iterations = args.iterations, threshold = 0),
+         False),
+        ("NMF(updateW = False)",
+         lambda x, V, W: NMF(V, W = W, k = W.shape[1],
+                             iterations = args.iterations, threshold = 0,
+                             updateW = False),
+         False),
+        ("NMF(updateW = False, prune = 0.01)",
+         lambda x, V, W: NMF(V, W = W, k = W.shape[1],
+                             iterations = args.iterations, threshold = 0,
+                             updateW = False, prune = 0.01),
+         False),
+        ("transcribeInstrument",
+         lambda x, V, W: transcribeInstrument(
+             V, W, iterations = args.iterations, threshold = 0),
+         False)]
+
+    for solver in SOLVERS[1:]:
+        templates += [
+            ("NMF(updateW = False, solver = %s)" % solver,
+             lambda x, V, W, solver = solver: NMF(
+                 V, W = W, k = W.shape[1], iterations = args.iterations,
+                 threshold = 0, updateW = False, solver = solver),
+             False)]
+
+    cases = []
+    for signal, load in signals:
+        selected = [(name + "/" + signal, function, hops)
+                    for name, function, hops in templates
+                    if (args.filter.lower() in
+                        (name + "/" + signal).lower())]
+        if (not selected):
+            continue
+
+        x, V, W = load()
+        numFrames = V.shape[1]
+        numHops = 1 + (len(x) - 2048)//hopSize
+
+        cases += [(name, functools.partial(function, x, V, W),
+                   numHops if (hops) else numFrames)
+                  for name, function, hops in selected]
+
+    return cases
+
+if (__name__ == "__main__"):
+
+    parser = argparse.ArgumentParser("Benchmark the NMF, spectrogram and "
+                                     + "normalization functions.")
+    parser.add_argument("--frames",
+                        help = "The number of synthetic frames. "
+                        + "(default = 2000)",
+                        type = int, default = 2000, dest = "frames")
+    parser.add_argument("--bins",
+                        help = "The number of synthetic frequency bins. "
+                        + "(default = 1025)",
+                        type = int, default = 1025, dest = "bins")
+    parser.add_argument("--notes",
+                        help = "The number of synthetic dictionary notes. "
+                        + "(default = 88)",
+                        type = int, default = 88, dest = "notes")
+    parser.add_argument("--hop",
+                        help = "The hop length in ms. (default = 10)",
+                        type = int, default = 10, dest = "hopLen")
+    parser.add_argument("--iterations",
+                        help = "The number of NMF iterations. (default = 20)",
+                        type = int, default = 20, dest = "iterations")
+    parser.add_argument("-r", "--repeat",
+                        help = "The number of timed calls. (default = 3)",
+                        type = int, default = 3, dest = "repeat")
+    parser.add_argument("-k", "--filter",
+                        help = "Only run cases containing this string.",
+                        type = str, default = "", dest = "filter")
+    parser.add_argument("--synthetic",
+                        help = "Only use synthetic inputs.",
+                        default = False, action = "store_true")
+    parser.add_argument("--seed",
+                        help = "The random seed. (default = 314)",
+                        type = int, default = 314, dest = "seed")
+    parser.add_argument("-c", "--compare",
+                        help = "A JSON file of an earlier run to compare to.",
+                        type = str, default = None, dest = "compare")
+    parser.add_argument("-d",
+                        help = "The destination JSON file. (default = None)",
+                        type = str, default = None, dest = "saveAs")
+    args = parser.parse_args()
+
+    baseline = {}
+    if (not args.compare is None):
+        with open(args.compare, "r") as f:
+            baseline = json.load(f)["results"]
+
+    results = {}
+    table = []
+    for name, function, numFrames in cases(args):
+        result = measure(function, numFrames, args.repeat)
+        results[name] = result
+
+        if ("error" in result):
+            row = [name, result["error"].split(":")[0], "", "", ""]
+        else:
+            row = [name, result["time"], result["fps"], result["memory"], ""]
+            if (name in baseline and "time" in baseline[name]):
+                row[-1] = baseline[name]["time"]/result["time"]
+        table += [row]
+        print ("Finished %s." % name + 20*' ', end = '\r')
+    print (60*' ', end = '\r')
+
+    headers = ["Case", "Time (s)", "Frames/s", "Peak memory (MB)", "Speedup"]
+    print(tabulate(table, headers, tablefmt = "github", floatfmt = ".3g"))
+
+    if (not args.saveAs is None):
+        run = {"settings": vars(args),
+               "platform": {"python": platform.python_version(),
+                            "numpy": np.__version__,
+                            "librosa": librosa.__version__,
+                            "machine": platform.machine()},
+               "results": results}
+        with open(args.saveAs, "w") as f:
+            json.dump(run, f, indent = 2)
@@ -4,116 +4,374 @@ Caculate NMF transcriptions.
 """
 
 import argparse
+import functools
 import librosa
 import numpy as np
 import os.path
+import scipy.sparse
 
+from lib.CQT import audioCQTspectrogram
 from lib.NMF import NMF
-from lib.normalize import maxNormalize
-from lib.normalize import RMSnormalize
-from lib.normalize import sumNormalize
+from lib.NMF import SOLVERS
+from lib.NMF import parallelNMF
+from lib.cache import cacheFile
+from lib.cache import cacheMemmap
+from lib.normalize import divide
+from lib.normalize import getNormalization
+from lib.normalize import normalizationFactors
 from lib.spectrogram import magnitudeSpectrogram
 from lib.utils import createDir
+from lib.utils import findFile
 
+AUDIO_PATH = "data/audio/"
 DICTIONARY_PATH = "data/dictionaries/"
 NMF_PATH = "data/NMFs/"
 SPECTROGRAM_PATH = "data/spectrograms/"
 
+def normalizeSpectrogram(S, norm = "max"):
+    """
+    Normalize the frequency bins of a spectrogram.
+
+    Keyword arguments:
+    S -- the spectrogram.
+    norm -- the normalization name. (default = "max")
+
+    Returns:
+    V -- the normalized spectrogram.
+    """
+
+    normalization = getNormalization(norm)
+    if (normalization is None):
+        return S
+
+    return normalization(S, axis = 1)
+
+def transcribe(V, W, updateW = False, H0 = None, dtype = np.float64,
+               beta = 2, solver = "mu", prune = 0, numWorkers = None,
+               iterations = 20, tolerance = 0, scale = None, out = None):
+    """
+    Calculate an NMF transcription of a spectrogram.
+
+    Keyword arguments:
+    V -- the normalized spectrogram, or the spectrogram if scale is
+        given.
+    W -- the instrument dictionary.
+    updateW -- whether to update the dictionary. (default = False)
+    H0 -- an existing transcription of the first frames of V to continue.
+        Only used with a fixed dictionary. (default = None)
+    dtype -- the floating point precision. (default = np.float64)
+    beta -- the beta-divergence minimized, 2 for the Frobenius norm and 1
+        for the Kullback-Leibler divergence. (default = 2)
+    solver -- the NMF solver, "mu", "hals", "amu" or "nnls".
+        (default = "mu")
+    prune -- drop activations below this fraction of the maximum of their
+        frame and return a sparse transcription. Only used with a fixed
+        dictionary and without H0. (default = 0)
+    numWorkers -- solve blocks of frames on this many threads, None to
+        solve all frames at once. Not available with pruning.
+        (default = None)
+    iterations -- the maximum number of iterations. (default = 20)
+    tolerance -- stop when the cost changes by less than this fraction
+        between iterations, 0 to stop at the absolute threshold of 0.001
+        only. When continuing H0 the default is 0.001. (default = 0)
+    scale -- normalization factors of the bins, a column V is divided by.
+        With numWorkers each block of frames is divided as it is solved,
+        so V can be a memory mapped spectrogram. (default = None)
+    out -- an array to write the dense transcription to, e.g. a memory
+        mapped .npy file. (default = None)
+
+    Returns:
+    H -- the transcription.
+    """
+
+    numBins, numNotes = W.shape
+
+    if (not H0 is None and (updateW or H0.shape[0] != numNotes
+                            or H0.shape[1] > V.shape[1])):
+        print ("Existing transcription does not match, recalculating.")
+        H0 = None
+
+    if (prune > 0 and not numWorkers is None):
+        raise ValueError("Pruned transcriptions are not solved in parallel.")
+
+    solve = NMF
+    if (not numWorkers is None):
+        solve = functools.partial(parallelNMF, numWorkers = numWorkers,
+                                  scale = scale,
+                                  out = out if (H0 is None) else None)
+    elif (not scale is None):
+        V = divide(V, scale)
+
+    if (H0 is None):
+        H, W = solve(V, H = None, W = W, k = numNotes, threshold = 0.001,
+                     iterations = iterations, updateW = updateW,
+                     verbose = False, dtype = dtype, beta = beta,
+                     solver = solver, prune = prune, tolerance = tolerance)
+    else:
+        # Columns are independent for a fixed dictionary, so only the new
+        # frames are calculated, starting from the last known activations.
+        # The new frames start close to their solution, so they stop on
+        # the relative cost change as in warmTranscription.
+        if (tolerance == 0):
+            tolerance = 0.001
+
+        start = H0.shape[1]
+        h = np.maximum(H0[:, -1], np.finfo(float).eps)
+        H = np.repeat(h.reshape((numNotes, 1)), V.shape[1] - start, axis = 1)
+        H, W = solve(V[:, start:], H = H, W = W, k = numNotes,
+                     threshold = 0.001, iterations = iterations,
+                     updateW = False, verbose = False, dtype = dtype,
+                     beta = beta, solver = solver, tolerance = tolerance)
+        H = np.concatenate((H0, H), axis = 1)
+
+    if (not out is None and not H is out):
+        out[:] = H
+        H = out
+
+    return H
+
+def loadDictionaries(dictionaryPaths):
+    """
+    Load instrument dictionaries stacked into one.
+
+    Keyword arguments:
+    dictionaryPaths -- the instrument dictionary files.
+
+    Returns:
+    W -- the dictionaries concatenated along the notes.
+    """
+
+    return np.concatenate([np.load(path) for path in dictionaryPaths],
+                          axis = 1)
+
+def calculateTranscription(spectrogramPath, *dictionaryPaths, norm = "max",
+                           updateW = False, dtype = "float64", beta = 2,
+                           solver = "mu", prune = 0, numWorkers = None,
+                           iterations = 20, tolerance = 0, out = None):
+    """
+    Calculate the NMF transcription of a spectrogram file.
+
+    Several dictionaries are stacked and solved together, so the rows of the
+    transcription follow the order of the dictionaries.
+
+    Keyword arguments:
+    spectrogramPath -- the spectrogram file.
+    dictionaryPaths -- the instrument dictionary files.
+    norm -- the spectrogram normalization. (default = "max")
+    updateW -- whether to update the dictionary. (default = False)
+    dtype -- the floating point precision. (default = "float64")
+    beta -- the beta-divergence minimized. (default = 2)
+    solver -- the NMF solver. (default = "mu")
+    prune -- the activation pruning fraction, 0 for a dense
+        transcription. (default = 0)
+    numWorkers -- the number of threads solving blocks of frames, None
+        to solve all frames at once. The spectrogram is then read and
+        normalized a block at a time. (default = None)
+    iterations -- the maximum number of iterations. (default = 20)
+    tolerance -- the relative cost change threshold. (default = 0)
+    out -- an array to write the dense transcription to, e.g. a memory
+        mapped .npy file. (default = None)
+
+    Returns:
+    H -- the transcription.
+    """
+
+    S = np.load(spectrogramPath, mmap_mode = "r")
+    W = loadDictionaries(dictionaryPaths)
+
+    if (numWorkers is None):
+        V = normalizeSpectrogram(S, norm)
+        scale = None
+    else:
+        V = S
+        scale = normalizationFactors(S, norm)
+
+    return transcribe(V, W, updateW, dtype = np.dtype(dtype), beta = beta,
+                      solver = solver, prune = prune, numWorkers = numWorkers,
+                      iterations = iterations, tolerance = tolerance,
+                      scale = scale, out = out)
+
 if (__name__ == "__main__"):
 
     parser = argparse.ArgumentParser("Calculate an NMF transcription.")
     parser.add_argument("excerpt", help = "The excerpt spectrogram file.",
                         type = str)
-    parser.add_argument("dictionary", help = "The instrument dictionary file.",
-                        type = str)
+    parser.add_argument("dictionaries",
+                        help = "The instrument dictionary files. Several "
+                        + "dictionaries are solved together and saved as "
+                        + "<excerpt>-<dictionary>_NMF.npy.", nargs = '+')
     parser.add_argument("--norm",
                         help = "The spectrogram normalization. " +
                         "(default = 'max')", type = str, default = "max",
                         dest = "norm")
     parser.add_argument("-d",
-                        help = "The destination file. (default = None)",
+                        help = "The destination file, or directory for "
+                        + "several dictionaries. (default = None)",
                         type = str, default = None, dest = "saveAs")
     parser.add_argument("--updateW", default = False, action = "store_true")
+    parser.add_argument("--resume",
+                        help = "Continue an existing transcription of the "
+                        + "first frames of the excerpt instead of "
+                        + "recalculating them. Requires a fixed dictionary.",
+                        default = False, action = "store_true")
+    parser.add_argument("--float32",
+                        help = "Calculate in single precision.",
+                        default = False, action = "store_true")
+    parser.add_argument("--beta",
+                        help = "The beta-divergence minimized, 2 for the "
+                        + "Frobenius norm and 1 for the Kullback-Leibler "
+                        + "divergence. (default = 2)",
+                        type = float, default = 2, dest = "beta")
+    parser.add_argument("--solver",
+                        help = "The NMF solver, 'mu', 'hals', 'amu' or "
+                        + "'nnls'. (default = 'mu')",
+                        type = str, default = "mu", dest = "solver")
+    parser.add_argument("--prune",
+                        help = "Drop activations below this fraction of the "
+                        + "maximum of their frame and save a sparse .npz "
+                        + "transcription. (default = 0)",
+                        type = float, default = 0, dest = "prune")
+    parser.add_argument("-j", "--jobs",
+                        help = "Solve blocks of frames on this many threads. "
+                        + "(default = None, all frames at once)",
+                        type = int, default = None, dest = "jobs")
+    parser.add_argument("-i", "--iterations",
+                        help = "The maximum number of iterations. "
+                        + "(default = 20)",
+                        type = int, default = 20, dest = "iterations")
+    parser.add_argument("--tolerance",
+                        help = "Stop when the cost changes by less than this "
+                        + "fraction between iterations, 0 to only stop at "
+                        + "the absolute threshold. (default = 0)",
+                        type = float, default = 0, dest = "tolerance")
+    parser.add_argument("--cqt",
+                        help = "Transcribe the CQT spectrogram of the "
+                        + "excerpt's audio file with the <dictionary>_CQT.npy "
+                        + "dictionaries. Transcriptions are saved as "
+                        + "<excerpt>_CQT.npy.",
+                        default = False, action = "store_true")
     args = parser.parse_args()
 
-    # Load spectrogram.
-    path = args.excerpt
-    while (True):
-        try:
-            S = np.load(path)
-            break
-        except:
-            pass
-
-        try:
-            S = np.np.load(path + ".npy")
-            break
-        except:
-            pass
-
-        try:
-            S = np.load(SPECTROGRAM_PATH + path)
-            break
-        except:
-            pass
-
-        try:
-            S = np.load(SPECTROGRAM_PATH + path + ".npy")
-            break
-        except:
-            pass
-
-        print ("Could not load spectrogram file!")
+    dtype = "float32" if (args.float32) else "float64"
+
+    if (not args.solver.lower() in SOLVERS):
+        print ("Unknown solver %s!" % args.solver)
+        raise SystemExit()
+
+    if (args.solver.lower() == "nnls" and args.updateW):
+        print ("The nnls solver requires a fixed dictionary!")
+        raise SystemExit()
+
+    if (not args.jobs is None and args.updateW
+        and (args.beta != 2 or args.solver.lower() != "mu")):
+        print ("Parallel dictionary updates require beta = 2 and the mu "
+               + "solver!")
         raise SystemExit()
 
-    # Load dictionary.
-    path = args.dictionary
-    while (True):
-        try:
-            W = np.load(path)
-            break
-        except:
-            pass
-
-        try:
-            W = np.np.load(path + ".npy")
-            break
-        except:
-            pass
-
-        try:
-            W = np.load(DICTIONARY_PATH + path)
-            break
-        except:
-            pass
-
-        try:
-            W = np.load(DICTIONARY_PATH + path + ".npy")
-            break
-        except:
-            pass
-
-        print ("Could not load dictionary file!")
+    if (args.prune > 0 and (args.updateW or args.resume or args.beta != 2
+                            or args.solver.lower() != "mu")):
+        print ("Pruning requires a fixed dictionary, beta = 2 and the mu "
+               + "solver, and cannot resume!")
         raise SystemExit()
 
-    if (args.norm.lower() == "max"):
-        V = maxNormalize(S, axis = 1)
-    elif (args.norm.lower() == "rms"):
-        V = RMSnormalize(S, axis = 1)
-    elif (args.norm.lower() == "sum"):
-        V = sumNormalize(S, axis = 1)
+    if (args.prune > 0 and not args.jobs is None):
+        print ("Pruned transcriptions are not solved in parallel, remove "
+               + "-j or --prune!")
+        raise SystemExit()
+
+    if (args.cqt):
+        audioPath = findFile(args.excerpt, [AUDIO_PATH], ".wav")
+        if (audioPath is None):
+            print ("Could not load audio file!")
+            raise SystemExit()
+        spectrogramPath = cacheFile(audioCQTspectrogram, [audioPath])
     else:
-        V = S
+        spectrogramPath = findFile(args.excerpt, [SPECTROGRAM_PATH])
+        if (spectrogramPath is None):
+            print ("Could not load spectrogram file!")
+            raise SystemExit()
+    numBins, numFrames = np.load(spectrogramPath, mmap_mode = "r").shape
 
-    numBins, numNotes = W.shape
+    dictionaryPaths = []
+    for dictionary in args.dictionaries:
+        dictionaryPath = None
+        if (args.cqt):
+            dictionaryPath = findFile(dictionary + "_CQT", [DICTIONARY_PATH])
+        if (dictionaryPath is None):
+            dictionaryPath = findFile(dictionary, [DICTIONARY_PATH])
+        if (dictionaryPath is None):
+            print ("Could not load dictionary file %s!" % dictionary)
+            raise SystemExit()
+        if (np.load(dictionaryPath, mmap_mode = "r").shape[0] != numBins):
+            print ("Dictionary %s does not have the spectrogram's %d bins!"
+                   % (dictionary, numBins))
+            raise SystemExit()
+        dictionaryPaths += [dictionaryPath]
+
+    # The stacked transcription is split into one file per dictionary.
+    suffix = "_CQT" if (args.cqt) else "_NMF"
+    if (len(dictionaryPaths) == 1):
+        paths = [args.saveAs]
+        if (args.saveAs is None):
+            paths = [NMF_PATH + args.excerpt
+                     + ("_CQT.npy" if args.cqt else ".npy")]
+    else:
+        directory = NMF_PATH
+        if (not args.saveAs is None):
+            directory = os.path.join(args.saveAs, "")
+        excerpt = os.path.splitext(os.path.basename(args.excerpt))[0]
+        names = [os.path.splitext(os.path.basename(path))[0]
+                 for path in dictionaryPaths]
+        if (args.cqt):
+            names = [name[:-len(suffix)] if name.endswith(suffix) else name
+                     for name in names]
+        paths = [directory + "%s-%s%s.npy" % (excerpt, name, suffix)
+                 for name in names]
 
-    H, W = NMF(V, H = None, W = W, k = numNotes, threshold = 0.001,
-               iterations = 20, updateW = args.updateW, verbose = False)
+    sizes = [np.load(path, mmap_mode = "r").shape[1]
+             for path in dictionaryPaths]
+    splits = np.cumsum(sizes)[:-1]
+    sources = [spectrogramPath] + dictionaryPaths
 
-    path = args.excerpt
-    if (args.saveAs is None):
-        path = NMF_PATH + path + ".npy"
+    if (args.prune > 0):
+        # Sparse transcriptions are saved as .npz and not cached.
+        H = calculateTranscription(*sources, norm = args.norm.lower(),
+                                   dtype = dtype, prune = args.prune,
+                                   iterations = args.iterations,
+                                   tolerance = args.tolerance)
+        H = H.tocsr()
+        for path, start, stop in zip(paths, [0] + list(splits),
+                                     list(splits) + [H.shape[0]]):
+            path = os.path.splitext(path)[0] + ".npz"
+            createDir(path)
+            scipy.sparse.save_npz(path, H[start:stop].tocsc())
     else:
-        path = args.saveAs
-    createDir(path)
-    np.save(path, H)
+        if (args.resume and all(os.path.isfile(path) for path in paths)):
+            S = np.load(spectrogramPath, mmap_mode = "r")
+            W = loadDictionaries(dictionaryPaths)
+            H0 = np.concatenate([np.load(path) for path in paths], axis = 0)
+
+            # Scale the new frames with the factors of the existing ones,
+            # calculated over the frames the existing transcription saw.
+            scale = normalizationFactors(S[:, :H0.shape[1]], args.norm)
+            H = transcribe(S, W, args.updateW, H0, np.dtype(dtype),
+                           args.beta, args.solver.lower(),
+                           numWorkers = args.jobs,
+                           iterations = args.iterations,
+                           tolerance = args.tolerance, scale = scale)
+        else:
+            # The transcription is calculated into the cache file.
+            shape = (sum(sizes), numFrames)
+            path = cacheMemmap(calculateTranscription, shape, sources,
+                               precision = dtype, norm = args.norm.lower(),
+                               updateW = args.updateW, dtype = dtype,
+                               beta = args.beta,
+                               solver = args.solver.lower(),
+                               numWorkers = args.jobs,
+                               iterations = args.iterations,
+                               tolerance = args.tolerance)
+            H = np.load(path, mmap_mode = "r")
+
+        for path, h in zip(paths, np.split(H, splits, axis = 0)):
+            createDir(path)
+            np.save(path, h)
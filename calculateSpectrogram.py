@@ -4,12 +4,14 @@ Caculate spectrograms.
 """
 
 import argparse
-import librosa
 import numpy as np
-import os.path
 
-from lib.spectrogram import magnitudeSpectrogram
+from lib.CQT import audioCQTspectrogram
+from lib.cache import cached
+from lib.spectrogram import audioSpectrogram
+from lib.stream import spectrogramFile
 from lib.utils import createDir
+from lib.utils import findFile
 
 AUDIO_PATH = "data/audio/"
 SPECTROGRAM_PATH = "data/spectrograms/"
@@ -27,44 +29,45 @@ if (__name__ == "__main__"):
     parser.add_argument("-d",
                         help = "The destination file. (default = None)",
                         type = str, default = None, dest = "saveAs")
+    parser.add_argument("--chunked",
+                        help = "Read the audio in blocks and write the "
+                        + "spectrogram directly to the destination file. The "
+                        + "file must have the given sampling frequency.",
+                        default = False, action = "store_true")
+    parser.add_argument("--cqt",
+                        help = "Calculate a CQT spectrogram with 480 bins, "
+                        + "saved as <excerpt>_CQT.npy by default.",
+                        default = False, action = "store_true")
     args = parser.parse_args()
 
-    path = args.excerpt
-
-    while (True):
-        try:
-            x, Fs = librosa.load(path, sr = args.Fs, mono = True)
-            break
-        except:
-            pass
-
-        try:
-            x, Fs = librosa.load(path + ".wav", sr = args.Fs, mono = True)
-            break
-        except:
-            pass
-
-        try:
-            x, Fs = librosa.load(AUDIO_PATH + path, sr = args.Fs, mono = True)
-            break
-        except:
-            pass
+    if (args.chunked and args.cqt):
+        print ("CQT spectrograms cannot be chunked!")
+        raise SystemExit()
 
-        try:
-            x, Fs = librosa.load(AUDIO_PATH + path + ".wav", sr = args.Fs,
-                                 mono = True)
-            break
-        except:
-            pass
+    path = args.excerpt
 
+    audioPath = findFile(path, [AUDIO_PATH], ".wav")
+    if (audioPath is None):
         print ("Could not load audio file!")
         raise SystemExit()
 
-    S = magnitudeSpectrogram(x, Fs = args.Fs, hopLen = args.hopLen)
-
     if (args.saveAs is None):
-        path = SPECTROGRAM_PATH + path + ".npy"
+        path = SPECTROGRAM_PATH + path + ("_CQT.npy" if args.cqt else ".npy")
     else:
         path = args.saveAs
     createDir(path)
-    np.save(path, S)
+
+    if (args.chunked):
+        try:
+            spectrogramFile(audioPath, path, args.Fs, hopLen = args.hopLen)
+        except ValueError as e:
+            print (e)
+            raise SystemExit()
+    elif (args.cqt):
+        S = cached(audioCQTspectrogram, [audioPath], Fs = args.Fs,
+                   hopLen = args.hopLen)
+        np.save(path, S)
+    else:
+        S = cached(audioSpectrogram, [audioPath], Fs = args.Fs,
+                   hopLen = args.hopLen)
+        np.save(path, S)
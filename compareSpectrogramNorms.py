@@ -3,22 +3,19 @@
 Compare different spectrogram normalization methods for NMF.
 """
 
-import numpy as np
-
 from tabulate import tabulate
 
 from lib.NMF import betaDivergence
 from lib.NMF import frobenius
 from lib.NMF import KLD
 from lib.NMF import NMF
+from lib.cache import cached
 from lib.normalize import maxNormalize
 from lib.normalize import RMSnormalize
 from lib.normalize import sumNormalize
-from lib.spectrogram import magnitudeSpectrogram
-from lib.utils import createDir
+from lib.spectrogram import audioSpectrogram
 
 AUDIO_PATH = "data/audio/"
-SPECTROGRAM_PATH = "data/spectrograms/"
 
 if (__name__ == "__main__"):
 
@@ -26,17 +23,10 @@ if (__name__ == "__main__"):
     hopLen = 10   # ms
     Fs = 44100
 
-    try:
-        print ("Loading spectrogram.")
-        S = np.load(SPECTROGRAM_PATH + excerpt + ".npy")
-    except:
-        print ("Spectrogram not found. Calcualting from audio.")
-        path = AUDIO_PATH + excerpt + ".wav"
-        x, Fs = librosa.load(path, sr = Fs, mono = True)
-        S = magnitudeSpectrogram(x, Fs)
-        path = SPECTROGRAM_PATH + excerpt + ".npy"
-        createDir(path)
-        np.save(path, S)
+    print ("Loading spectrogram.")
+    path = AUDIO_PATH + excerpt + ".wav"
+    S = cached(audioSpectrogram, [path], mmap = True, Fs = Fs,
+               hopLen = hopLen)
 
     table = []
     headers = ["Normalization", "Frobenius norm", "Beta divergence", "KLD"]
@@ -0,0 +1,105 @@
+"""@package NMF-visualization
+
+Score NMF transcriptions against ground truths.
+"""
+
+import argparse
+import json
+import numpy as np
+import os
+
+from tabulate import tabulate
+
+from lib.evaluation import evaluateFile
+from lib.utils import findFile
+
+NMF_PATH = "data/NMFs/"
+TRUTH_PATH = "data/truths/"
+
+def truthFile(path):
+    """
+    Return the ground truth file of a transcription.
+
+    Transcriptions named <excerpt>_<suffix>.npy are matched to
+    <excerpt>_truth.npy.
+
+    Keyword arguments:
+    path -- the transcription file.
+
+    Returns:
+    path -- the ground truth file, or None if there is none.
+    """
+
+    name = os.path.splitext(os.path.basename(path))[0]
+    excerpt = name.rsplit("_", 1)[0]
+
+    return findFile(excerpt + "_truth", [TRUTH_PATH])
+
+if (__name__ == "__main__"):
+
+    parser = argparse.ArgumentParser("Score transcriptions against ground "
+                                     + "truths.")
+    parser.add_argument("transcriptions", help = "The transcriptions to score. "
+                        + "(default = all in " + NMF_PATH + ")", nargs = '*')
+    parser.add_argument("-t", "--truths",
+                        help = "The corresponding ground truths. "
+                        + "(default = matched by excerpt name)",
+                        nargs = '*', default = [], dest = "truths")
+    parser.add_argument("--steps",
+                        help = "The number of thresholds. (default = 100)",
+                        type = int, default = 100, dest = "steps")
+    parser.add_argument("--truthThreshold",
+                        help = "The fraction of its maximum at which the "
+                        + "ground truth is active. (default = 0.5)",
+                        type = float, default = 0.5, dest = "truthThreshold")
+    parser.add_argument("--tolerance",
+                        help = "The onset tolerance in frames. (default = 5)",
+                        type = int, default = 5, dest = "tolerance")
+    parser.add_argument("-d",
+                        help = "The destination JSON file. (default = None)",
+                        type = str, default = None, dest = "saveAs")
+    args = parser.parse_args()
+
+    transcriptions = args.transcriptions
+    if (len(transcriptions) == 0):
+        transcriptions = sorted(NMF_PATH + name
+                                for name in os.listdir(NMF_PATH)
+                                if name.endswith(".npy"))
+
+    thresholds = np.linspace(0, 1, args.steps + 1)[1:]
+
+    results = {}
+    table = []
+    for i, path in enumerate(transcriptions):
+        transcriptionPath = findFile(path, [NMF_PATH])
+        truthPath = None
+        if (i < len(args.truths)):
+            truthPath = findFile(args.truths[i], [TRUTH_PATH])
+        elif (not transcriptionPath is None):
+            truthPath = truthFile(transcriptionPath)
+
+        if (transcriptionPath is None or truthPath is None):
+            print ("Could not find %s or its ground truth!" % path)
+            continue
+
+        result = evaluateFile(transcriptionPath, truthPath,
+                              thresholds = thresholds,
+                              truthThreshold = args.truthThreshold,
+                              tolerance = args.tolerance)
+        results[transcriptionPath] = {"truth": truthPath}
+        results[transcriptionPath].update({key: np.asarray(value).tolist()
+                                           for key, value in result.items()})
+
+        frame = np.argmax(result["frameF"])
+        onset = np.argmax(result["onsetF"])
+        table += [[transcriptionPath, result["frameF"][frame],
+                   thresholds[frame], result["onsetF"][onset],
+                   thresholds[onset], result["time"]]]
+
+    headers = ["Transcription", "Frame F", "Threshold", "Onset F",
+               "Threshold", "Time (s)"]
+    print(tabulate(table, headers, tablefmt = "github", floatfmt = ".3g"))
+
+    if (not args.saveAs is None):
+        with open(args.saveAs, "w") as f:
+            json.dump(results, f, indent = 2)
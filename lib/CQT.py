@@ -1,57 +1,148 @@
 """@package CQT
 Functions for generating constant-Q transform spectrograms.
+
+The transform is multirate. The spectral kernel of the highest octave is
+calculated once for each sampling frequency and bin layout and kept in
+memory, and every lower octave applies the same kernel to the signal
+decimated by two once more. Frames are centred on the frames of an STFT with
+the same hop, so CQT and STFT spectrograms of a signal have the same number
+of frames.
 """
 
+import functools
 import librosa
 import math
 import numpy as np
+import scipy.sparse
+
+from scipy.signal import resample_poly
+
+@functools.lru_cache(maxsize = None)
+def CQTkernel(Fs = 44100, fMin = 27.5, numOctaves = 8, octaveBins = 60,
+              window = "hann", sparsity = 0.005):
+    """
+    Calculate the spectral kernel of the highest CQT octave.
+
+    Kernels are cached, so the filters are only calculated once per process.
+    Worker processes forked after a call share the parent's kernel.
+
+    Keyword arguments:
+    Fs -- sampling frequency. (default = 44100)
+    fMin -- the lowest bin frequency. (default = 27.5)
+    numOctaves -- the number of octaves. (default = 8)
+    octaveBins -- the number of bins per octave. (default = 60)
+    window -- the window to use. (default = "hann")
+    sparsity -- kernel values below this fraction of the maximum of their
+        bin are dropped. (default = 0.005)
+
+    Returns:
+    K -- the conjugated kernel as a sparse octaveBins x (fftLen/2 + 1)
+        matrix, applied to the rfft of frames of fftLen samples.
+    """
+
+    # Bin frequencies of the highest octave.
+    f = fMin*np.power(2, numOctaves - 1 + np.arange(octaveBins)/octaveBins)
+    if (f[-1] >= Fs/2):
+        raise ValueError("The highest CQT bin (%.1f Hz) is above the Nyquist "
+                         "frequency (%.1f Hz)!" % (f[-1], Fs/2))
+
+    Q = 1/(np.power(2, 1/octaveBins) - 1)
+    N = np.ceil(Q*Fs/f).astype(int)     # Bin window sizes.
+    fftLen = 2**math.ceil(math.log2(N[0]))
+
+    kernel = np.zeros((octaveBins, fftLen), dtype = np.complex128)
+    for j in range(octaveBins):
+        w = librosa.filters.get_window(window, N[j], fftbins = False)
+        n = np.arange(N[j]) - N[j]//2
+        start = fftLen//2 - N[j]//2
+
+        # Scaled so a sinusoid of amplitude A has magnitude A/2.
+        kernel[j, start:start + N[j]] = (w/np.sum(w)
+                                         *np.exp(2j*np.pi*f[j]*n/Fs))
 
-def CQTspectrogram(x, Fs, hopLen = 10, fftSize = 2048,
-                   fMin = 27.5, numOctaves = 8,
-                   octaveBins = 60, **kwargs):
+    K = np.fft.fft(kernel, axis = 1)[:, :fftLen//2 + 1]
+    K[np.abs(K) < sparsity*np.max(np.abs(K), axis = 1, keepdims = True)] = 0
+
+    return scipy.sparse.csr_matrix(np.conj(K)/fftLen)
+
+def CQTspectrogram(x, Fs = 44100, hopLen = 10, fftSize = 2048,
+                   fMin = 27.5, numOctaves = 8, octaveBins = 60,
+                   blockSize = 1024, **kwargs):
     """
-    Calculate a magnitude spectrogram.
-    
+    Calculate a constant-Q magnitude spectrogram.
+
     NOTE the number of CQT bins = octaves x bins per octave
-    
+
+    Frame t is centred on sample t*hopSize + fftSize/2, the centre of the
+    corresponding magnitudeSpectrogram frame. In the lower octaves frames are
+    centred on the nearest decimated sample.
+
     Keyword arguments:
     x -- input signal.
-    Fs -- sampling frequency.
-    hopLen -- the hop length in ms. (default = H)
-    fftSize -- the FFT size. (default = FFT_SIZE)
-    fMin -- the lowest bin frequency. (default = CQT_F1)
-    numOctaves -- the number of octaves. (default = CQT_OCTAVES)
-    octaveBins -- the number of bins per octave. 
-        (default = CQT_OCTAVE_BINS)
-    
+    Fs -- sampling frequency. (default = 44100)
+    hopLen -- the hop length in ms. (default = 10)
+    fftSize -- the FFT size of the STFT the frames are aligned to.
+        (default = 2048)
+    fMin -- the lowest bin frequency. (default = 27.5)
+    numOctaves -- the number of octaves. (default = 8)
+    octaveBins -- the number of bins per octave. (default = 60)
+    blockSize -- the number of frames transformed at once. (default = 1024)
+
+    Returns:
+    S -- the CQT spectrogram representation of x, lowest bin first.
+    """
+
+    hopSize = math.floor(hopLen*Fs/1000)
+    numFrames = max(0, 1 + (len(x) - fftSize)//hopSize)
+
+    K = CQTkernel(Fs, fMin, numOctaves, octaveBins)
+    fftLen = 2*(K.shape[1] - 1)
+
+    dtype = np.result_type(x, np.float32)
+    S = np.empty((numOctaves*octaveBins, numFrames), dtype = dtype)
+    centres = np.arange(numFrames)*hopSize + fftSize//2
+
+    # From the highest octave down, decimating the signal by two per octave.
+    for octave in range(numOctaves):
+        if (octave > 0):
+            x = resample_poly(x, 1, 2)
+
+        # Frame starts in the signal padded by fftLen/2.
+        starts = np.round(centres/2**octave).astype(int)
+        pad = fftLen//2
+        end = np.max(starts, initial = 0) + pad - len(x)
+        xp = np.pad(x, (pad, max(pad, end)))
+
+        rows = slice((numOctaves - 1 - octave)*octaveBins,
+                     (numOctaves - octave)*octaveBins)
+        for start in range(0, numFrames, blockSize):
+            stop = min(start + blockSize, numFrames)
+            frames = xp[starts[start:stop, None] + np.arange(fftLen)]
+            X = np.fft.rfft(frames, axis = 1)
+            S[rows, start:stop] = np.abs(K @ X.T)
+
+    return S
+
+def audioCQTspectrogram(path, Fs = 44100, hopLen = 10, fftSize = 2048,
+                        fMin = 27.5, numOctaves = 8, octaveBins = 60):
+    """
+    Load an audio file and calculate its constant-Q magnitude spectrogram.
+
+    Keyword arguments:
+    path -- the audio file path.
+    Fs -- sampling frequency. (default = 44100)
+    hopLen -- the hop length in ms. (default = 10)
+    fftSize -- the FFT size of the STFT the frames are aligned to.
+        (default = 2048)
+    fMin -- the lowest bin frequency. (default = 27.5)
+    numOctaves -- the number of octaves. (default = 8)
+    octaveBins -- the number of bins per octave. (default = 60)
+
     Returns:
-    S -- the CQT spectrogram representation of x.
+    S -- the CQT spectrogram of the file.
     """
-    
-    numBins = numOctaves*octaveBins
-    
-    hopTarget = math.floor(hopLen*Fs/1000)
-    hopSize = 2**(numBins//octaveBins)
-    hopSize0 = hopSize
-    while (hopTarget > hopSize):
-        hopSize += hopSize0
-        
-    # Check minimum signal length.
-    f1 = fMin*np.power(2, numOctaves-1)     # Minimum bin frequency 
-                                            # of highest octave.
-    q = 1
-    N = q*Fs/(f1*(np.power(2, 1/octaveBins) - 1))   # Bin window size.
-    fftPoints = 1
-    while (fftPoints < N):
-        fftPoints *= 2
-    minLen = fftPoints*np.power(2, numOctaves-1)
-    
-    if (len(x) < minLen):
-        x = np.concatenate((x, np.zeros(minLen - len(x))))  # Pad.
-    
-    # CQT
-    S = librosa.cqt(x, sr = Fs, hop_length = hopSize, fmin = fMin, 
-                    n_bins = numBins, bins_per_octave = octaveBins, 
-                    window = WINDOW, pad_mode = PAD_MODE)
-    
-    return abs(S)
+
+    x, Fs = librosa.load(path, sr = Fs, mono = True)
+
+    return CQTspectrogram(x, Fs, hopLen, fftSize, fMin, numOctaves,
+                          octaveBins)
@@ -5,104 +5,1024 @@ Functions for approximating the factors of a non-negative matrix.
 """
 
 import numpy as np
+import scipy.sparse
 
-def betaDivergence(X, Y, beta = 0.5):
-    """
-    Return the beta-divergence for X and its
-    approximation..
+from concurrent.futures import ThreadPoolExecutor
+from scipy.optimize import nnls
+
+from lib.divergence import betaDivergence
+from lib.divergence import frobenius
+from lib.divergence import KLD
+from lib.normalize import divide
+from lib.normalize import normalizationFactors
+
+SOLVERS = ["mu", "hals", "amu", "nnls"]
 
+def inner(A, B):
+    """
+    Return the sum of the element-wise product of two matrices, accumulated
+    in double precision.
+    
     Keyword arguments:
-    X - a matrix.
-    Y - X's approximation
-    beta -- (default 0.5)
+    A -- a matrix.
+    B -- a matrix with the same shape.
+    """
     
-    Returns:
-    c -- the beta divergence.
+    return np.einsum("ij,ij->", A, B, dtype = np.float64)
+
+def converged(c, c_, threshold, tolerance):
     """
+    Return whether a cost has fallen below the threshold or changed by less
+    than the relative tolerance since the previous cost.
     
-    c = (np.power(X, beta) + (beta-1)*np.power(Y, beta) 
-            - beta*np.multiply(X, np.power(Y, beta - 1)))
-    c = np.sum(c)/(beta*(beta - 1))
+    Keyword arguments:
+    c -- the cost.
+    c_ -- the previous cost, np.inf if there is none.
+    threshold -- the cost threshold.
+    tolerance -- the relative cost change threshold, 0 to ignore.
+    """
     
-    return c
+    return c < threshold or (tolerance > 0 and abs(c_ - c) <= tolerance*c)
 
-def frobenius(X, Y):
+def iterate(step, cost, iterations = 200, threshold = 0.0001, tolerance = 0,
+            costInterval = 1, verbose = False):
     """
-    Return the Frobenius norm for X and its
-    approximation.
+    Repeat an update until the cost converges.
+    
+    Keyword arguments:
+    step -- a function performing one iteration of the updates.
+    cost -- a function returning the cost after the last step.
+    iterations -- the maximum number of iterations. (default = 200)
+    threshold -- the cost threshold. (default = 0.0001)
+    tolerance -- the relative cost change threshold, 0 to ignore.
+        (default = 0)
+    costInterval -- calculate the cost every this many iterations.
+        (default = 1)
+    verbose -- whether to print the cost. (default = False)
+    """
+    
+    c_ = np.inf
+    
+    for i in range(iterations):
+        step()
+        
+        if ((i + 1)%costInterval != 0 and i + 1 < iterations):
+            continue
+        
+        c = cost()
+        
+        if (verbose):
+            print (("Iteration %d, cost = %.3g" % (i, c)) + 10*' ', end = '\r')
+        
+        if (converged(c, c_, threshold, tolerance)):
+            break
+        c_ = c
 
+def NMF(V, H = None, W = None, k = 1, threshold = 0.0001, iterations = 200,
+        updateW = True, verbose = False, seed = 314, dtype = np.float64,
+        costInterval = 1, beta = 2, blockSize = 4096, solver = "mu",
+        tolerance = 0, prune = 0, **kwargs):
+    """
+    Return H and W, the approximate non-negative factors of V.
+    
+    Approximate V = W.H with the multiplicative update rules for the
+    beta-divergence. For beta = 2, the Frobenius norm, the updates reuse
+    preallocated buffers and the cost is calculated from the products
+    needed by the next update, so no bins x frames temporaries are
+    allocated per iteration. When W is fixed the products W^T.V and W^T.W
+    do not change between iterations, so they are calculated once.
+    
+    The Frobenius norm can also be minimized with hierarchical alternating
+    least squares ("hals"), which updates one row of H or column of W at a
+    time in closed form, with accelerated multiplicative updates ("amu"),
+    which repeat the cheap updates of one factor while the products with the
+    other factor are reused, or, for a fixed W, with exact non-negative
+    least squares ("nnls"). With a fixed W and pruning, H is solved on its
+    active support only and returned as a sparse matrix, see sparseNMF.
+    
     Keyword arguments:
-    X - a matrix.
-    Y - X's approximation
+    V -- the matrix to factorize.
+    H -- an initialization for H. (default = None)
+    W -- an initialization for W. (default = None)
+    k -- the rank of the factorization. (default = 1)
+    threshold -- the cost threshold. (default = 0.0001)
+    iterations -- the maximum number of iterations. (default = 200)
+    updateW -- whether to update W. (default = True)
+    verbose -- whether to print the cost. (default = False)
+    seed -- the random initialization seed. (default = 314)
+    dtype -- the floating point precision, np.float32 halves memory and
+        is sufficient for spectrograms. (default = np.float64)
+    costInterval -- calculate the cost every this many iterations.
+        (default = 1)
+    beta -- the beta-divergence parameter, 2 for the Frobenius norm and 1
+        for the Kullback-Leibler divergence. (default = 2)
+    blockSize -- the number of columns updated at once for beta other
+        than 2. (default = 4096)
+    solver -- "mu", "hals", "amu" or "nnls". (default = "mu")
+    tolerance -- stop when the cost changes by less than this fraction
+        between cost calculations, 0 to only use the threshold.
+        (default = 0)
+    prune -- with a fixed W, drop activations below this fraction of the
+        maximum of their frame and return H as a sparse matrix, 0 to keep
+        H dense. (default = 0)
     
     Returns:
-    c -- the Frobenius norm.
+    H -- the activation matrix.
+    W -- the dictionary matrix.
     """
+
+    rng = np.random.default_rng(seed)
+
+    if (W is None):
+        W = 1 - rng.random((V.shape[0], k))
+
+    if (prune > 0):
+        if (updateW):
+            raise ValueError("Pruning requires a fixed W.")
+        if (solver.lower() != "mu" or beta != 2):
+            raise ValueError("Pruning requires the mu solver and beta = 2.")
+        return sparseNMF(np.asarray(V, dtype = dtype), W, H, threshold,
+                         iterations, prune, blockSize = blockSize,
+                         tolerance = tolerance, verbose = verbose,
+                         seed = seed)
+
+    if (H is None):
+        H = 1 - rng.random((k, V.shape[1]))
+
+    V = np.asarray(V, dtype = dtype)
+    solver = solver.lower()
+
+    if (solver != "mu" and beta != 2):
+        raise ValueError("The %s solver only minimizes the Frobenius norm."
+                         % solver)
+
+    if (solver == "nnls"):
+        if (updateW):
+            raise ValueError("The nnls solver requires a fixed W.")
+        return nnlsNMF(V, W)
+    elif (solver == "hals"):
+        return halsNMF(V, H, W, threshold, iterations, updateW, verbose,
+                       costInterval, tolerance)
+    elif (solver == "amu"):
+        return acceleratedNMF(V, H, W, threshold, iterations, updateW,
+                              verbose, costInterval, tolerance)
+    elif (solver != "mu"):
+        raise ValueError("Unknown solver %s." % solver)
+
+    if (beta != 2):
+        return betaNMF(V, H, W, beta, threshold, iterations, updateW,
+                       verbose, costInterval, blockSize, tolerance)
+
+    if (not updateW):
+        return fixedNMF(V, H, W, threshold, iterations, verbose,
+                        costInterval, tolerance)
+
+    # Copies, the factors are updated in place.
+    W = np.array(W, dtype = dtype)
+    H = np.array(H, dtype = dtype)
+    k = W.shape[1]
+
+    # Work buffers.
+    WV = np.matmul(W.T, V)
+    WW = np.matmul(W.T, W)
+    WWH = np.empty_like(H)
+    H_ = np.empty_like(H)
+    HH = np.empty((k, k), dtype = dtype)
+    VH = np.empty_like(W)
+    WHH = np.empty_like(W)
+    VV = inner(V, V)
+
+    def step():
+        nonlocal H, W
+        np.copyto(H_, H)
+
+        # Update H.
+        np.matmul(WW, H, out = WWH)
+        H *= WV
+        H /= WWH
+
+        # Update W.
+        np.matmul(V, H_.T, out = VH)
+        np.matmul(H_, H_.T, out = HH)
+        np.matmul(W, HH, out = WHH)
+        W *= VH
+        W /= WHH
+
+        # W^T.V and W^T.W are used by the next H update.
+        np.matmul(W.T, V, out = WV)
+        np.matmul(W.T, W, out = WW)
+
+    def cost():
+        # ||V - W.H||^2 = ||V||^2 - 2 tr(H^T.W^T.V) + tr(W^T.W.H.H^T).
+        np.matmul(H, H.T, out = HH)
+        return 0.5*max(VV - 2*inner(H, WV) + inner(WW, HH), 0)
+
+    iterate(step, cost, iterations, threshold, tolerance, costInterval,
+            verbose)
+
+    return H, W
+
+def fixedNMF(V, H, W, threshold = 0.0001, iterations = 200, verbose = False,
+             costInterval = 1, tolerance = 0):
+    """
+    Return H and W, the approximate non-negative factors of V, with W fixed.
+    
+    The Gram matrices W^T.V and W^T.W are cached and the Frobenius cost is
+    calculated with the trace identity
+    ||V - W.H||^2 = ||V||^2 - 2 tr(H^T.W^T.V) + tr(H^T.W^T.W.H),
+    so each iteration costs O(k^2 frames) instead of O(bins k frames).
+    The calculation uses the precision of V.
     
-    A = abs(X - Y)
+    Keyword arguments:
+    V -- the matrix to factorize.
+    H -- an initialization for H.
+    W -- the known factor.
+    threshold -- the cost threshold. (default = 0.0001)
+    iterations -- the maximum number of iterations. (default = 200)
+    verbose -- whether to print the cost. (default = False)
+    costInterval -- calculate the cost every this many iterations.
+        (default = 1)
+    tolerance -- the relative cost change threshold. (default = 0)
+    
+    Returns:
+    H -- the activation matrix.
+    W -- the dictionary matrix.
+    """
+
+    dtype = V.dtype if (V.dtype.kind == "f") else np.float64
+    H = np.array(H, dtype = dtype)
+    W = np.asarray(W, dtype = dtype)
+
+    WV = np.matmul(W.T, V)
+    WW = np.matmul(W.T, W)
+    VV = inner(V, V)
+    WWH = np.matmul(WW, H)
 
-    return 0.5*np.sum(np.power(A, 2))
+    def step():
+        nonlocal H
+        H *= WV
+        H /= WWH
+        np.matmul(WW, H, out = WWH)
 
-def KLD(X, Y):
+    def cost():
+        return 0.5*max(VV - 2*inner(H, WV) + inner(H, WWH), 0)
+
+    iterate(step, cost, iterations, threshold, tolerance, costInterval,
+            verbose)
+
+    return H, W
+
+def betaTerms(V, WH, F, beta, left = True):
     """
-    Return the Kullback-Liebler divergence for X and its
-    approximation.
+    Return the numerator and denominator of a beta-divergence update.
     
     Keyword arguments:
-    X - a matrix.
-    Y - X's approximation
+    V -- the matrix to factorize.
+    WH -- the approximation of V, overwritten.
+    F -- W, multiplied from the left as W^T, or H^T, multiplied from the
+        right.
+    beta -- the beta-divergence parameter.
+    left -- whether F is multiplied from the left. (default = True)
     
     Returns:
-    c -- the Kullback-Liebler divergence.
+    num -- the product of F and V (W.H)^(beta - 2).
+    den -- the product of F and (W.H)^(beta - 1), or None for beta = 1
+        where it is the sum of F.
+    """
+
+    if (beta == 1):
+        A = np.divide(V, WH, out = WH)
+        B = None
+    else:
+        B = np.power(WH, beta - 1)
+        A = np.divide(B, WH, out = WH)
+        A *= V
+
+    if (left):
+        num = np.matmul(F.T, A)
+        den = None if (B is None) else np.matmul(F.T, B)
+    else:
+        num = np.matmul(A, F)
+        den = None if (B is None) else np.matmul(B, F)
+
+    return num, den
+
+def betaNMF(V, H, W, beta = 1, threshold = 0.0001, iterations = 200,
+            updateW = True, verbose = False, costInterval = 1,
+            blockSize = 4096, tolerance = 0):
     """
+    Return H and W, the approximate non-negative factors of V.
     
-    # Avoid zero division
-    if (abs(Y).min() == 0):
-        Y += np.full(Y.shape, 1e-32)
-        print ("Warning! Almost divided by 0!")
+    Approximate V = W.H with the multiplicative update rules for the
+    beta-divergence. Each iteration passes over blocks of columns, updates
+    the block of H and accumulates the numerator and denominator of the W
+    update from the updated block, so the W update, applied after the pass,
+    uses the new H as in the sequential update rules. Updating both factors
+    from the same approximation makes their scales overshoot and the cost
+    oscillate. The cost is calculated from the approximation used by the H
+    update, so it is the cost of the previous iteration. The calculation
+    uses the precision of V.
     
-    kld = np.multiply(X, np.log10(X/Y)) - X + Y
+    Keyword arguments:
+    V -- the matrix to factorize.
+    H -- an initialization for H.
+    W -- an initialization for W.
+    beta -- the beta-divergence parameter. (default = 1)
+    threshold -- the cost threshold. (default = 0.0001)
+    iterations -- the maximum number of iterations. (default = 200)
+    updateW -- whether to update W. (default = True)
+    verbose -- whether to print the cost. (default = False)
+    costInterval -- calculate the cost every this many iterations.
+        (default = 1)
+    blockSize -- the number of columns updated at once. (default = 4096)
+    tolerance -- the relative cost change threshold. (default = 0)
     
-    return np.sum(kld)
+    Returns:
+    H -- the activation matrix.
+    W -- the dictionary matrix.
+    """
 
-def NMF(V, H = None, W = None, k = 1, threshold = 0.0001, iterations = 200,
-        updateW = True, verbose = False, seed = 314, **kwargs):
+    dtype = V.dtype if (V.dtype.kind == "f") else np.float64
+    W = np.array(W, dtype = dtype)
+    H = np.array(H, dtype = dtype)
+    numBins, numFrames = V.shape
+    eps = np.finfo(dtype).tiny
 
-    rng = np.random.default_rng(seed)
+    WA = np.empty((numBins, W.shape[1]), dtype = dtype)
+    WB = np.empty_like(WA)
+    c_ = np.inf
 
-    if (W is None):
-        W = 1 - rng.random((V.shape[0], k))
+    for i in range(iterations):
+        computeCost = (i + 1)%costInterval == 0 or i + 1 == iterations
+        c = 0
+        WA.fill(0)
+        WB.fill(0)
+        Wsum = np.sum(W, axis = 0).reshape((-1, 1))
 
-    if (H is None):
-        H = 1 - rng.random((k, V.shape[1]))
+        for start in range(0, numFrames, blockSize):
+            stop = min(start + blockSize, numFrames)
+            v = V[:, start:stop]
+            h = H[:, start:stop]
 
-    for i in range(iterations):
-        H_ = H.copy()
+            Wh = np.matmul(W, h)
+            np.maximum(Wh, eps, out = Wh)
 
-        # Update H.
-        WV = np.matmul(W.T, V)
-        WW = np.matmul(W.T, W)
-        WWH = np.matmul(WW, H)
-        H = H*WV/WWH
+            if (computeCost):
+                c += betaDivergence(v, Wh, beta)
+
+            # Update H. For beta = 1 the denominator is the sum of W.
+            num, den = betaTerms(v, Wh, W, beta)
+            h *= num
+            h /= np.maximum(Wsum if (den is None) else den, eps)
+
+            if (not updateW):
+                continue
+
+            Wh = np.matmul(W, h)
+            np.maximum(Wh, eps, out = Wh)
+            num, den = betaTerms(v, Wh, h.T, beta, left = False)
+            WA += num
+            WB += np.sum(h, axis = 1) if (den is None) else den
 
         # Update W.
         if (updateW):
-            VH = np.matmul(V, H_.T)
-            WH = np.matmul(W, H_)
-            WHH = np.matmul(WH, H_.T)
-            W = W*VH/WHH
+            W *= WA
+            W /= np.maximum(WB, eps)
 
-        # Get cost.
-        Vapprox = np.matmul(W, H)
-        c = 0.5*np.sum(np.power(V - Vapprox, 2))
+        if (not computeCost):
+            continue
 
         if (verbose):
             print (("Iteration %d, cost = %.3g" % (i, c)) + 10*' ', end = '\r')
 
-        if (c < threshold):
+        if (converged(c, c_, threshold, tolerance)):
             break
+        c_ = c
+
+    return H, W
+
+def alternatingNMF(V, H, W, updateH, updateWt, threshold = 0.0001,
+                   iterations = 200, updateW = True, verbose = False,
+                   costInterval = 1, tolerance = 0):
+    """
+    Return H and W, the approximate non-negative factors of V, alternating
+    updates of H and W^T that only need the products with the other
+    factor.
+    
+    The Frobenius cost is calculated from the products W^T.V, W^T.W and
+    H.H^T kept for the updates. The calculation uses the precision of V.
+    
+    Keyword arguments:
+    V -- the matrix to factorize.
+    H -- an initialization for H.
+    W -- an initialization for W.
+    updateH -- a function updating H in place, called as
+        updateH(H, W^T.V, W^T.W).
+    updateWt -- a function updating W^T in place, called as
+        updateWt(W^T, H.V^T, H.H^T).
+    threshold -- the cost threshold. (default = 0.0001)
+    iterations -- the maximum number of iterations. (default = 200)
+    updateW -- whether to update W. (default = True)
+    verbose -- whether to print the cost. (default = False)
+    costInterval -- calculate the cost every this many iterations.
+        (default = 1)
+    tolerance -- the relative cost change threshold. (default = 0)
+    
+    Returns:
+    H -- the activation matrix.
+    W -- the dictionary matrix.
+    """
+
+    dtype = V.dtype if (V.dtype.kind == "f") else np.float64
+    W = np.array(W, dtype = dtype)
+    H = np.array(H, dtype = dtype)
+
+    WV = np.matmul(W.T, V)
+    WW = np.matmul(W.T, W)
+    HH = np.empty((W.shape[1], W.shape[1]), dtype = dtype)
+    VV = inner(V, V)
+
+    def step():
+        updateH(H, WV, WW)
+        np.matmul(H, H.T, out = HH)
+
+        if (updateW):
+            updateWt(W.T, np.matmul(H, V.T), HH)
+            np.matmul(W.T, V, out = WV)
+            np.matmul(W.T, W, out = WW)
+
+    def cost():
+        return 0.5*max(VV - 2*inner(H, WV) + inner(WW, HH), 0)
+
+    iterate(step, cost, iterations, threshold, tolerance, costInterval,
+            verbose)
+
+    return H, W
+
+def halsUpdate(H, WV, WW, eps):
+    """
+    Update the rows of H in place by hierarchical alternating least squares.
+    
+    Each row is set to its non-negative least squares solution with the
+    other rows fixed, using the products W^T.V and W^T.W.
+    
+    Keyword arguments:
+    H -- the factor to update.
+    WV -- the product W^T.V.
+    WW -- the product W^T.W.
+    eps -- the smallest allowed value.
+    """
+    
+    for j in range(H.shape[0]):
+        if (WW[j, j] <= 0):
+            continue
+        H[j] += (WV[j] - np.matmul(WW[j], H))/WW[j, j]
+        np.maximum(H[j], eps, out = H[j])
+
+def halsNMF(V, H, W, threshold = 0.0001, iterations = 200, updateW = True,
+            verbose = False, costInterval = 1, tolerance = 0):
+    """
+    Return H and W, the approximate non-negative factors of V.
+    
+    Approximate V = W.H by hierarchical alternating least squares for the
+    Frobenius norm. The rows of H and the columns of W are updated one at a
+    time, so each update is exact and no iteration increases the cost. The
+    calculation uses the precision of V.
+    
+    Keyword arguments:
+    V -- the matrix to factorize.
+    H -- an initialization for H.
+    W -- an initialization for W.
+    threshold -- the cost threshold. (default = 0.0001)
+    iterations -- the maximum number of iterations. (default = 200)
+    updateW -- whether to update W. (default = True)
+    verbose -- whether to print the cost. (default = False)
+    costInterval -- calculate the cost every this many iterations.
+        (default = 1)
+    tolerance -- the relative cost change threshold. (default = 0)
+    
+    Returns:
+    H -- the activation matrix.
+    W -- the dictionary matrix.
+    """
+
+    dtype = V.dtype if (V.dtype.kind == "f") else np.float64
+    # A tiny floor would make later products subnormal and slow.
+    eps = np.finfo(dtype).eps
+
+    def update(H, WV, WW):
+        halsUpdate(H, WV, WW, eps)
+
+    return alternatingNMF(V, H, W, update, update, threshold, iterations,
+                          updateW, verbose, costInterval, tolerance)
+
+def acceleratedUpdate(H, WV, WW, repeats, delta = 0.1):
+    """
+    Repeat the multiplicative update of H in place with W^T.V and W^T.W
+    fixed.
+    
+    Keyword arguments:
+    H -- the factor to update.
+    WV -- the product W^T.V.
+    WW -- the product W^T.W.
+    repeats -- the maximum number of updates.
+    delta -- stop when an update changes H by less than this fraction of
+        the change of the first update. (default = 0.1)
+    """
+    
+    H_ = np.empty_like(H)
+    first = 0
+    
+    for i in range(repeats):
+        np.copyto(H_, H)
+        H *= WV
+        H /= np.matmul(WW, H_)
+        
+        H_ -= H
+        change = inner(H_, H_)
+        if (i == 0):
+            first = change
+        elif (change <= delta*delta*first):
+            break
+
+def acceleratedNMF(V, H, W, threshold = 0.0001, iterations = 200,
+                   updateW = True, verbose = False, costInterval = 1,
+                   tolerance = 0, alpha = 0.5):
+    """
+    Return H and W, the approximate non-negative factors of V.
+    
+    Approximate V = W.H with accelerated multiplicative updates for the
+    Frobenius norm. Calculating V.H^T and W^T.V costs much more than an
+    update with them, so each factor is updated several times in a row,
+    in proportion to that ratio, until the updates stop changing it (Gillis
+    and Glineur, 2012). The calculation uses the precision of V.
+    
+    Keyword arguments:
+    V -- the matrix to factorize.
+    H -- an initialization for H.
+    W -- an initialization for W.
+    threshold -- the cost threshold. (default = 0.0001)
+    iterations -- the maximum number of iterations. (default = 200)
+    updateW -- whether to update W. (default = True)
+    verbose -- whether to print the cost. (default = False)
+    costInterval -- calculate the cost every this many iterations.
+        (default = 1)
+    tolerance -- the relative cost change threshold. (default = 0)
+    alpha -- the number of repeated updates relative to the cost ratio.
+        (default = 0.5)
+    
+    Returns:
+    H -- the activation matrix.
+    W -- the dictionary matrix.
+    """
+
+    numBins, numFrames = V.shape
+    k = np.shape(W)[1]
 
-    return H, W      
+    repeatsH = 1 + int(alpha*(1 + (numBins*numFrames + numBins*k)
+                                  /(numFrames*(k + 1))))
+    repeatsW = 1 + int(alpha*(1 + (numBins*numFrames + numFrames*k)
+                                  /(numBins*(k + 1))))
+
+    def updateH(H, WV, WW):
+        acceleratedUpdate(H, WV, WW, repeatsH)
+
+    def updateWt(Wt, HV, HH):
+        acceleratedUpdate(Wt, HV, HH, repeatsW)
+
+    return alternatingNMF(V, H, W, updateH, updateWt, threshold, iterations,
+                          updateW, verbose, costInterval, tolerance)
+
+def nnlsNMF(V, W):
+    """
+    Return H and W, the exact non-negative least squares factor of V for a
+    fixed W.
+    
+    W is replaced by the triangular factor R of its QR decomposition, so
+    each column is solved as a k x k problem instead of a bins x k one.
+    
+    Keyword arguments:
+    V -- the matrix to factorize.
+    W -- the known factor.
+    
+    Returns:
+    H -- the activation matrix.
+    W -- the dictionary matrix.
+    """
+
+    W = np.asarray(W)
+    Q, R = np.linalg.qr(np.asarray(W, dtype = np.float64))
+    B = np.matmul(Q.T, V)
+    dtype = V.dtype if (V.dtype.kind == "f") else np.float64
+    H = np.empty((W.shape[1], V.shape[1]), dtype = dtype)
+
+    for j in range(V.shape[1]):
+        H[:, j], _ = nnls(R, B[:, j])
+
+    return H, W
+
+def pruneSupport(H, num, prune):
+    """
+    Drop the entries of a sparse H below a fraction of their column maximum.
+    
+    Keyword arguments:
+    H -- the activations, a scipy.sparse CSC matrix.
+    num -- the values of W^T.V on the support of H.
+    prune -- the fraction of the column maximum to keep.
+    
+    Returns:
+    H -- the pruned activations.
+    num -- the values of W^T.V on the pruned support.
+    cols -- the column of each entry of H.
+    """
+    
+    numFrames = H.shape[1]
+    cols = np.repeat(np.arange(0, numFrames), np.diff(H.indptr))
+    colMax = H.max(axis = 0).toarray().ravel()
+    keep = (H.data >= prune*colMax[cols]) & (H.data > 0)
+    
+    cols = cols[keep]
+    indptr = np.zeros(numFrames + 1, dtype = H.indptr.dtype)
+    np.cumsum(np.bincount(cols, minlength = numFrames), out = indptr[1:])
+    H = scipy.sparse.csc_matrix((H.data[keep], H.indices[keep], indptr),
+                                shape = H.shape)
+    
+    return H, num[keep], cols
+
+def supportGram(H, cols, WW):
+    """
+    Return the matrix mapping the values of a sparse H to those of W^T.W.H
+    on its support.
+    
+    For a column with s entries the s x s block of W^T.W on their rows is
+    stored, so applying the matrix costs the sum of the squared column
+    supports instead of k times the number of entries.
+    
+    Keyword arguments:
+    H -- the activations, a scipy.sparse CSC matrix.
+    cols -- the column of each entry of H.
+    WW -- the product W^T.W.
+    
+    Returns:
+    M -- a scipy.sparse CSR matrix, or None if it would have more entries
+        than a dense H.
+    """
+    
+    counts = np.diff(H.indptr)[cols]
+    numPairs = int(np.sum(counts))
+    if (numPairs > H.shape[0]*H.shape[1]):
+        return None
+    
+    indptr = np.zeros(H.nnz + 1, dtype = np.int64)
+    np.cumsum(counts, out = indptr[1:])
+    entry = np.repeat(np.arange(0, H.nnz), counts)
+    partner = (np.repeat(H.indptr[cols] - indptr[:-1], counts)
+               + np.arange(0, numPairs))
+    weights = WW[H.indices[entry], H.indices[partner]]
+    
+    return scipy.sparse.csr_matrix((weights, partner, indptr),
+                                   shape = (H.nnz, H.nnz))
+
+def sparseNMF(V, W, H = None, threshold = 0.0001, iterations = 200,
+              prune = 0.01, pruneInterval = 5, blockSize = 4096,
+              tolerance = 0, verbose = False, seed = 314, warmup = 20,
+              density = 0.1):
+    """
+    Return H and W, the approximate non-negative factors of V, with W fixed
+    and H sparse.
+    
+    Blocks of columns are solved in turn with the multiplicative updates for
+    the Frobenius norm. After the first warmup iterations, and every
+    pruneInterval iterations after that, activations below prune times the
+    maximum of their frame are set to zero. Multiplicative updates keep
+    zeros at zero, so once at most a density fraction of the activations
+    is left only the remaining (note, frame) pairs are stored and updated:
+    W^T.V is sampled once on the support and an update costs O(k nnz)
+    instead of O(k^2 frames). Until then the block is updated densely,
+    since the sparse products are slower per entry than dense ones. The
+    cost on the support is calculated with the trace identity and each
+    block stops on its own cost. The calculation uses the precision of V.
+    
+    Keyword arguments:
+    V -- the matrix to factorize.
+    W -- the known factor.
+    H -- an initialization for H. (default = None)
+    threshold -- the cost threshold of each block. (default = 0.0001)
+    iterations -- the maximum number of iterations. (default = 200)
+    prune -- the fraction of the maximum of a frame below which
+        activations are dropped. (default = 0.01)
+    pruneInterval -- prune every this many iterations. (default = 5)
+    blockSize -- the number of columns solved at once. (default = 4096)
+    tolerance -- the relative cost change threshold. (default = 0)
+    verbose -- whether to print the cost. (default = False)
+    seed -- the random initialization seed. (default = 314)
+    warmup -- the number of dense iterations before the first pruning.
+        (default = 20)
+    density -- the largest fraction of activations left for which the
+        block is solved on its support. (default = 0.1)
+    
+    Returns:
+    H -- the activation matrix, a scipy.sparse CSC matrix.
+    W -- the dictionary matrix.
+    """
+
+    dtype = V.dtype if (V.dtype.kind == "f") else np.float64
+    W = np.asarray(W, dtype = dtype)
+    numBins, numFrames = V.shape
+    k = W.shape[1]
+    rng = np.random.default_rng(seed)
+    eps = np.finfo(dtype).eps
+
+    WW = np.matmul(W.T, W)
+    blocks = []
+
+    for start in range(0, numFrames, blockSize):
+        stop = min(start + blockSize, numFrames)
+        v = np.asarray(V[:, start:stop], dtype = dtype)
+        if (H is None):
+            h = 1 - rng.random((k, stop - start))
+        else:
+            h = H[:, start:stop]
+        h = np.array(h, dtype = dtype)
+
+        VV = inner(v, v)
+        WV = np.matmul(W.T, v)
+        WWH = np.empty_like(h)
+        c_ = np.inf
+        done = False
+
+        # Dense updates until the pruned activations are sparse enough.
+        first = 0
+        while (first < iterations):
+            np.matmul(WW, h, out = WWH)
+            c = 0.5*max(VV - 2*inner(h, WV) + inner(h, WWH), 0)
+
+            if (verbose):
+                print (("Frames %d-%d, iteration %d, cost = %.3g"
+                        % (start, stop, first, c)) + 10*' ', end = '\r')
+
+            h *= WV
+            h /= np.maximum(WWH, eps, out = WWH)
+            first += 1
+
+            if (converged(c, c_, threshold, tolerance)):
+                done = True
+                break
+            c_ = c
+
+            if (first >= warmup and (first - warmup)%pruneInterval == 0):
+                h[h < prune*np.max(h, axis = 0)] = 0
+                if (np.count_nonzero(h) <= density*h.size):
+                    break
+
+        # Switch to the support.
+        h[h < prune*np.max(h, axis = 0)] = 0
+        Hs = scipy.sparse.csc_matrix(h)
+        cols = np.repeat(np.arange(0, h.shape[1]), np.diff(Hs.indptr))
+        num = WV[Hs.indices, cols]
+        del h, WV, WWH
+
+        last = first if (done) else iterations
+        if (first < last):
+            M = supportGram(Hs, cols, WW)
+        for i in range(first, last):
+            if (M is None):
+                den = np.asarray(Hs.T @ WW)[cols, Hs.indices]
+            else:
+                den = M @ Hs.data
+            c = 0.5*max(VV - 2*np.dot(num, Hs.data)
+                        + np.dot(den, Hs.data), 0)
+
+            if (verbose):
+                print (("Frames %d-%d, iteration %d, cost = %.3g"
+                        % (start, stop, i, c)) + 10*' ', end = '\r')
+
+            Hs.data *= num
+            Hs.data /= np.maximum(den, eps)
+
+            if (converged(c, c_, threshold, tolerance)):
+                break
+            c_ = c
+
+            if ((i + 1 - warmup)%pruneInterval == 0):
+                Hs, num, cols = pruneSupport(Hs, num, prune)
+                M = supportGram(Hs, cols, WW)
+
+        Hs, num, cols = pruneSupport(Hs, num, prune)
+        blocks += [Hs]
+
+    return scipy.sparse.hstack(blocks, format = "csc"), W
+
+def parallelNMF(V, H = None, W = None, k = 1, threshold = 0.0001,
+                iterations = 200, updateW = True, verbose = False, seed = 314,
+                dtype = np.float64, blockSize = 8192, numWorkers = None,
+                out = None, scale = None, **kwargs):
+    """
+    Return H and W, the approximate non-negative factors of V, solving
+    blocks of frames in parallel.
+    
+    V is split into blocks of columns that are solved on a thread pool,
+    NumPy releases the GIL in matrix products, and only the blocks being
+    solved are read, so V and H can be memory mapped. With a fixed W the
+    blocks are independent and each is solved to the end by NMF, stopping
+    on its own cost. When W is updated, each iteration the workers update
+    their blocks of H with the multiplicative updates for the Frobenius
+    norm and return the block sums of V.H^T, H.H^T and the cost, which are
+    added to update W once all blocks are done. The random initialization
+    of each block is seeded with its index, so the result does not depend
+    on the number of workers.
+    
+    Keyword arguments:
+    V -- the matrix to factorize.
+    H -- an initialization for H. (default = None)
+    W -- an initialization for W. (default = None)
+    k -- the rank of the factorization. (default = 1)
+    threshold -- the cost threshold. (default = 0.0001)
+    iterations -- the maximum number of iterations. (default = 200)
+    updateW -- whether to update W. (default = True)
+    verbose -- whether to print the cost. (default = False)
+    seed -- the random initialization seed. (default = 314)
+    dtype -- the floating point precision. (default = np.float64)
+    blockSize -- the number of frames per block. (default = 8192)
+    numWorkers -- the number of threads. (default = None, the number of
+        CPUs)
+    out -- an array to write H to, e.g. a memory mapped .npy file.
+        (default = None)
+    scale -- normalization factors of the rows of V, a column each block
+        is divided by when it is read, so a memory mapped V is never
+        normalized as a whole. (default = None)
+    
+    Keyword arguments are passed to NMF for a fixed W. Pruning is not
+    supported, as the blocks are written to a dense H.
+    
+    Returns:
+    H -- the activation matrix.
+    W -- the dictionary matrix.
+    """
+
+    numBins, numFrames = V.shape
+    rng = np.random.default_rng(seed)
+
+    if (W is None):
+        W = 1 - rng.random((numBins, k))
+    W = np.array(W, dtype = dtype)
+    k = W.shape[1]
+
+    if (updateW and (kwargs.get("beta", 2) != 2
+                     or kwargs.get("solver", "mu") != "mu")):
+        raise ValueError("W is only updated with the mu solver and "
+                         + "beta = 2.")
+
+    if (kwargs.get("prune", 0) > 0):
+        raise ValueError("Pruned blocks cannot be solved in parallel.")
+
+    if (out is None):
+        out = np.empty((k, numFrames), dtype = dtype)
+
+    starts = range(0, numFrames, blockSize)
+
+    def read(start):
+        stop = min(start + blockSize, numFrames)
+        if (scale is None):
+            return np.asarray(V[:, start:stop], dtype = dtype)
+        return divide(V[:, start:stop], scale, dtype = dtype)
+
+    def block(start):
+        stop = min(start + blockSize, numFrames)
+        if (H is None):
+            blockRng = np.random.default_rng((seed, start//blockSize))
+            return 1 - blockRng.random((k, stop - start))
+        return np.array(H[:, start:stop], dtype = dtype)
+
+    def solve(start):
+        stop = min(start + blockSize, numFrames)
+        v = read(start)
+        out[:, start:stop], _ = NMF(v, block(start), W, k, threshold,
+                                    iterations, updateW = False,
+                                    dtype = dtype, **kwargs)
+
+    def step(start):
+        stop = min(start + blockSize, numFrames)
+        v = read(start)
+        h = out[:, start:stop]
+        WV = np.matmul(W.T, v)
+        WWH = np.matmul(WW, h)
+        c = 0.5*max(inner(v, v) - 2*inner(h, WV) + inner(h, WWH), 0)
+
+        # Update H and return the statistics of the updated block.
+        h *= WV
+        h /= WWH
+
+        return c, np.matmul(v, h.T), np.matmul(h, h.T)
+
+    with ThreadPoolExecutor(max_workers = numWorkers) as executor:
+        if (not updateW):
+            list(executor.map(solve, starts))
+            return out, W
+
+        for start in starts:
+            out[:, start:min(start + blockSize, numFrames)] = block(start)
+
+        c_ = np.inf
+        for i in range(iterations):
+            WW = np.matmul(W.T, W)
+            VH = np.zeros((numBins, k))
+            HH = np.zeros((k, k))
+            c = 0
+            for blockC, blockVH, blockHH in executor.map(step, starts):
+                c += blockC
+                VH += blockVH
+                HH += blockHH
+
+            # Update W.
+            WHH = np.matmul(W, HH)
+            W *= VH
+            W /= WHH
+
+            if (verbose):
+                print (("Iteration %d, cost = %.3g" % (i, c)) + 10*' ',
+                       end = '\r')
+
+            if (converged(c, c_, threshold, kwargs.get("tolerance", 0))):
+                break
+            c_ = c
+
+    return out, W
+
+def onlineNMF(sources, W = None, k = 1, batchSize = 1024, passes = 1,
+              iterations = 20, norm = None, seed = 314, dtype = np.float64,
+              verbose = False):
+    """
+    Learn a dictionary from matrices streamed in batches of columns.
+    
+    The batches of all sources are visited in a random order. The
+    activations of each batch are solved with the current W fixed, and
+    the sufficient statistics A = V.H^T and B = H.H^T are accumulated over
+    all batches so far. W is then updated by block coordinate descent on
+    ||V - W.H||^2 given A and B, with its columns kept non-negative and
+    projected to at most unit norm (Mairal et al., 2010). Only one batch,
+    A and B are held in memory, so the sources can be memory mapped files
+    much larger than memory.
+    
+    Keyword arguments:
+    sources -- matrices with the same number of rows, e.g. memory mapped
+        spectrograms.
+    W -- an initialization for W. (default = None)
+    k -- the rank of the dictionary. (default = 1)
+    batchSize -- the number of columns per batch. (default = 1024)
+    passes -- the number of passes over the sources. (default = 1)
+    iterations -- the number of iterations solving the activations of a
+        batch. (default = 20)
+    norm -- normalize the rows of each source, "max", "rms" or "sum".
+        (default = None)
+    seed -- the random seed. (default = 314)
+    dtype -- the floating point precision. (default = np.float64)
+    verbose -- whether to print progress. (default = False)
+    
+    Returns:
+    W -- the dictionary matrix.
+    """
+
+    rng = np.random.default_rng(seed)
+    numBins = sources[0].shape[0]
+
+    if (W is None):
+        W = 1 - rng.random((numBins, k))
+    W = np.array(W, dtype = dtype)
+    W /= np.maximum(np.linalg.norm(W, axis = 0), 1)
+    k = W.shape[1]
+    eps = np.finfo(dtype).eps
+
+    factors = [None if (norm is None) else normalizationFactors(X, norm)
+               for X in sources]
+    batches = [(i, start) for i, X in enumerate(sources)
+               for start in range(0, X.shape[1], batchSize)]
+
+    A = np.zeros((numBins, k))
+    B = np.zeros((k, k))
+
+    for p in range(passes):
+        for n, j in enumerate(rng.permutation(len(batches))):
+            i, start = batches[j]
+            v = np.asarray(sources[i][:, start:start + batchSize],
+                           dtype = dtype)
+            if (not factors[i] is None):
+                v = divide(v, factors[i], inPlace = True)
+
+            h = 1 - rng.random((k, v.shape[1]))
+            h, _ = fixedNMF(v, h, W, 0, iterations)
+            A += np.matmul(v, h.T)
+            B += np.matmul(h, h.T)
+
+            # Update the columns of W, the rows of W^T.
+            halsUpdate(W.T, A.T, B, eps)
+            W /= np.maximum(np.linalg.norm(W, axis = 0), 1)
+
+            if (verbose):
+                print (("Pass %d, batch %d of %d" % (p, n + 1, len(batches)))
+                       + 10*' ', end = '\r')
+
+    return W
 
 def frameNMF(v, W, beta = 0.5, h = None, threshold = 0.0001, cost = frobenius,
              iterations = 200, **kwargs):
@@ -147,38 +1067,162 @@ def frameNMF(v, W, beta = 0.5, h = None, threshold = 0.0001, cost = frobenius,
     
     return h, c
 
-def transcribeInstrument(V, W, cost = "frobenius", **kwargs):
+def batchNMF(V, W, beta = 0.5, H = None, threshold = 0.0001, cost = frobenius,
+             iterations = 200, blockSize = 4096, tolerance = 0,
+             costInterval = 1, **kwargs):
     """
     Return H, the approximation for the unkown factor of V.
     
-    Approximate H such that V = W.H, using the multiplicative
-    update rule with W known.
+    Vectorized equivalent of calling frameNMF on every column of V. The
+    multiplicative updates are applied to blocks of columns at once and
+    columns are dropped from the update as soon as their cost falls below
+    the threshold, or changes by less than the relative tolerance.
+    
+    Keyword arguments:
+    V -- the matrix to factorize.
+    W -- the known factor matrix.
+    beta -- the beta divergence parameter. (default 0.5)
+    H -- an initialization for H. (default = None)
+    threshold -- the cost threshold. (default = 0.0001)
+    cost -- the cost function, summing over the given axis.
+        (default = frobenius)
+    iterations -- the maximum number of iterations. (default = 200)
+    blockSize -- the number of columns updated at once. (default = 4096)
+    tolerance -- the relative cost change threshold. (default = 0)
+    costInterval -- calculate the cost and drop converged columns every
+        this many iterations. (default = 1)
+    
+    Returns:
+    H -- the approximation for the unknown factor.
+    c -- the cost for each column of V.
+    """
+    
+    V = np.asarray(V)
+    W = np.asarray(W)
+    numBins, numFrames = V.shape
+    numBins, numNotes = W.shape
+    
+    if (H is None):
+        # Draw in the same order as successive calls to frameNMF.
+        H = (1 - np.random.rand(numFrames, numNotes)).T
+    H = np.array(H, dtype = float)
+    c = np.full(numFrames, np.inf)
+    
+    for start in range(0, numFrames, blockSize):
+        active = np.arange(start, min(start + blockSize, numFrames))
+        
+        for i in range(iterations):
+            v = V[:, active]
+            h = H[:, active]
+            
+            # Update H
+            Wh = np.matmul(W, h)
+            a = np.matmul(W.T, v*np.power(Wh, beta - 2))
+            b = np.matmul(W.T, np.power(Wh, beta - 1))
+            h = h*a/b
+            H[:, active] = h
+            
+            if ((i + 1)%costInterval != 0 and i + 1 < iterations):
+                continue
+            
+            # Calculate cost and drop converged columns.
+            c_ = c[active]
+            c[active] = cost(v, np.matmul(W, h), axis = 0)
+            done = c[active] <= threshold
+            if (tolerance > 0):
+                done |= abs(c_ - c[active]) <= tolerance*c[active]
+            active = active[~done]
+            
+            if (active.size == 0):
+                break
+    
+    return H, c
+
+def warmTranscription(V, W, H0 = None, blockSize = 8, tolerance = 0.001,
+                      **kwargs):
+    """
+    Return H, the approximation for the unkown factor of V.
+    
+    Blocks of consecutive frames are solved in order and each block is
+    initialized with the last activations of the previous block. Adjacent
+    frames are similar, so with a relative cost tolerance stationary
+    passages converge in a few iterations.
     
     Keyword arguments:
     V -- the matrix to factorize.
     W -- the known factor.
-    cost -- the cost function. (default = "frobenius")
+    H0 -- activations for the first frames of V, which are kept as is,
+        e.g. an earlier transcription of a shorter recording. Frames
+        beyond the end of V are ignored. (default = None)
+    blockSize -- the number of frames per block. (default = 8)
+    tolerance -- the relative cost change threshold. (default = 0.001)
+    
+    Keyword arguments are passed to batchNMF.
+    
+    Returns:
+    H -- the approximation for the unknown factor.
     """
     
     numBins, numFrames = V.shape
     numBins, numNotes = W.shape
     
-    H = np.empty((numFrames, numNotes))
+    H = np.empty((numNotes, numFrames))
+    h = None
+    start = 0
+    
+    if (not H0 is None and H0.shape[1] > 0):
+        start = min(H0.shape[1], numFrames)
+        H[:, :start] = H0[:, :start]
+        h = H0[:, start - 1]
+    
+    for i in range(start, numFrames, blockSize):
+        j = min(i + blockSize, numFrames)
+        
+        Hblock = None
+        if (not h is None):
+            # Keep activations positive so they can still be updated.
+            h = np.maximum(h, np.finfo(float).eps)
+            Hblock = np.repeat(h.reshape((numNotes, 1)), j - i, axis = 1)
+        
+        H[:, i:j], _ = batchNMF(V[:, i:j], W, H = Hblock,
+                                tolerance = tolerance, **kwargs)
+        h = H[:, j - 1]
+    
+    return H
+
+def transcribeInstrument(V, W, cost = "frobenius", warmStart = False,
+                         H0 = None, **kwargs):
+    """
+    Return H, the approximation for the unkown factor of V.
+    
+    Approximate H such that V = W.H, using the multiplicative
+    update rule with W known.
+    
+    Keyword arguments:
+    V -- the matrix to factorize.
+    W -- the known factor.
+    cost -- the cost function. (default = "frobenius")
+    warmStart -- whether to initialize frames with the activations of
+        the previous frames. (default = False)
+    H0 -- activations for the first frames of V to continue from.
+        (default = None)
+    """
     
     cost = cost.lower()
     if (cost == "kld"):
         c = KLD
     elif (cost == "beta"):
         if ("beta" in kwargs):
-            def c(X, Y):
-                return betaDivergence(X, Y, kwargs["beta"])
+            def c(X, Y, axis = None):
+                return betaDivergence(X, Y, kwargs["beta"], axis = axis)
         else :
             c = betaDivergence
     else:
         c = frobenius
     
-    for i in range(numFrames):
-        v = V[:, i].reshape((numBins, 1))
-        H[i], _ = frameNMF(v, W, cost = c, **kwargs)
+    if (warmStart or not H0 is None):
+        return warmTranscription(V, W, H0 = H0, cost = c, **kwargs)
+    
+    H, _ = batchNMF(V, W, cost = c, **kwargs)
     
-    return H.T
+    return H
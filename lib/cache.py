@@ -0,0 +1,278 @@
+"""@package NMF-visualization
+
+Content addressed cache for calculated arrays.
+
+Arrays are stored under a key hashed from the calculating function, the
+contents of its source files and all of its parameters, so a cached array
+is never reused for different inputs or settings. The key also covers the
+code of the function's module and of the lib package, so changes to the
+calculation are never served results of the old code. The least recently used
+arrays are evicted when the cache grows beyond its size limit.
+"""
+
+import glob
+import hashlib
+import inspect
+import numpy as np
+import os
+
+from lib.utils import createDir
+
+CACHE_PATH = "data/cache/"
+CACHE_SIZE = 4*2**30    # bytes
+CACHE_VERSION = 1       # Increase to invalidate all cached arrays.
+
+LIB_PATH = os.path.dirname(os.path.abspath(__file__))
+
+fileHashes = {}
+
+def hashFile(path):
+    """
+    Return the SHA-1 hash of a file's contents.
+
+    Hashes are remembered for as long as the file's size and modification
+    time do not change.
+
+    Keyword arguments:
+    path -- the file path.
+    """
+
+    stat = os.stat(path)
+    key = (os.path.abspath(path), stat.st_size, stat.st_mtime_ns)
+    if (not key in fileHashes):
+        h = hashlib.sha1()
+        with open(path, "rb") as f:
+            for block in iter(lambda: f.read(2**20), b""):
+                h.update(block)
+        fileHashes[key] = h.hexdigest()
+
+    return fileHashes[key]
+
+def hashValue(value):
+    """
+    Return a string identifying a parameter value.
+
+    Keyword arguments:
+    value -- the parameter value.
+    """
+
+    if (isinstance(value, np.ndarray)):
+        h = hashlib.sha1(np.ascontiguousarray(value).tobytes())
+        return "array(%s, %s, %s)" % (value.dtype, value.shape, h.hexdigest())
+    elif (callable(value)):
+        # Scripts run directly are named by their file.
+        module = value.__module__
+        if (module == "__main__"):
+            module = os.path.basename(inspect.getfile(value))[:-3]
+        return "%s.%s" % (module, value.__qualname__)
+    elif (isinstance(value, dict)):
+        return "{%s}" % ", ".join("%r: %s" % (k, hashValue(value[k]))
+                                  for k in sorted(value))
+    elif (isinstance(value, (list, tuple))):
+        return "[%s]" % ", ".join(hashValue(v) for v in value)
+
+    return repr(value)
+
+def codeHash(function):
+    """
+    Return a hash of the code a calculation may depend on.
+
+    The function's own file and every module of the lib package are
+    hashed, so editing any of them changes the keys of the function.
+
+    Keyword arguments:
+    function -- the calculating function.
+    """
+
+    paths = sorted(glob.glob(os.path.join(LIB_PATH, "*.py")))
+    try:
+        path = os.path.abspath(inspect.getfile(function))
+        if (not path in paths):
+            paths += [path]
+    except TypeError:
+        pass
+
+    h = hashlib.sha1(str(CACHE_VERSION).encode())
+    for path in paths:
+        h.update(hashFile(path).encode())
+
+    return h.hexdigest()
+
+def cacheKey(function, sources = [], **params):
+    """
+    Return the cache key of a calculation.
+
+    The function's default parameter values are included, so calls relying
+    on defaults and calls passing them explicitly share a key.
+
+    Keyword arguments:
+    function -- the calculating function, called as
+        function(*sources, **params).
+    sources -- the source file paths. (default = [])
+    """
+
+    arguments = inspect.signature(function).bind(*sources, **params)
+    arguments.apply_defaults()
+    arguments = dict(arguments.arguments)
+
+    # Sources are identified by their contents rather than their paths. A
+    # variable positional parameter takes all remaining sources.
+    count = len(sources)
+    for name, parameter in inspect.signature(function).parameters.items():
+        if (count == 0):
+            break
+        del arguments[name]
+        if (parameter.kind == inspect.Parameter.VAR_POSITIONAL):
+            break
+        count -= 1
+
+    h = hashlib.sha1(hashValue(function).encode())
+    h.update(codeHash(function).encode())
+    for path in sources:
+        h.update(hashFile(path).encode())
+    h.update(hashValue(arguments).encode())
+
+    return h.hexdigest()
+
+def evict(maxSize = CACHE_SIZE, keep = None):
+    """
+    Remove the least recently used arrays until the cache fits in a size.
+
+    Keyword arguments:
+    maxSize -- the maximum cache size in bytes. (default = CACHE_SIZE)
+    keep -- a cache file that should not be removed. (default = None)
+    """
+
+    if (not os.path.isdir(CACHE_PATH)):
+        return
+
+    files = []
+    for name in os.listdir(CACHE_PATH):
+        path = os.path.join(CACHE_PATH, name)
+        if (name.endswith(".npy") and os.path.isfile(path)):
+            stat = os.stat(path)
+            files += [(stat.st_mtime, stat.st_size, path)]
+
+    size = sum(f[1] for f in files)
+    for mtime, fileSize, path in sorted(files):
+        if (size <= maxSize):
+            break
+        if (path == keep):
+            continue
+        try:
+            os.remove(path)
+        except FileNotFoundError:
+            pass
+        size -= fileSize
+
+def cachePath(function, sources = [], **params):
+    """
+    Return the path a calculation's array is cached at.
+
+    Keyword arguments:
+    function -- the function returning the array, called as
+        function(*sources, **params).
+    sources -- the source file paths. (default = [])
+    """
+
+    return CACHE_PATH + cacheKey(function, sources, **params) + ".npy"
+
+def saveCache(path, X):
+    """
+    Store an array in the cache.
+
+    Keyword arguments:
+    path -- the cache path, from cachePath.
+    X -- the array.
+    """
+
+    # Write to a temporary file first so other processes never read a
+    # partially written array.
+    createDir(path)
+    tmp = "%s.%d.tmp" % (path, os.getpid())
+    with open(tmp, "wb") as f:
+        np.save(f, X)
+    os.replace(tmp, path)
+
+    evict(CACHE_SIZE, keep = path)
+
+def cacheFile(function, sources = [], **params):
+    """
+    Return the path of a cached array, calculating it if needed.
+
+    Keyword arguments:
+    function -- the function returning the array, called as
+        function(*sources, **params).
+    sources -- the source file paths. (default = [])
+    """
+
+    path = cachePath(function, sources, **params)
+
+    if (os.path.isfile(path)):
+        # Mark as recently used.
+        os.utime(path)
+        return path
+
+    saveCache(path, function(*sources, **params))
+
+    return path
+
+def cacheMemmap(function, shape, sources = [], precision = np.float64,
+                **params):
+    """
+    Return the path of a cached array, calculating it into a memory mapped
+    file if needed.
+
+    The function writes the array to the file instead of returning it, so
+    the array never has to fit in memory.
+
+    Keyword arguments:
+    function -- the calculating function, called as
+        function(*sources, out = X, **params) with X the memory mapped
+        array.
+    shape -- the shape of the array.
+    sources -- the source file paths. (default = [])
+    precision -- the dtype of the array. (default = np.float64)
+    """
+
+    path = cachePath(function, sources, **params)
+
+    if (os.path.isfile(path)):
+        # Mark as recently used.
+        os.utime(path)
+        return path
+
+    # Calculate into a temporary file so other processes never read a
+    # partially written array.
+    createDir(path)
+    tmp = "%s.%d.tmp" % (path, os.getpid())
+    try:
+        X = np.lib.format.open_memmap(tmp, mode = "w+", dtype = precision,
+                                      shape = shape)
+        function(*sources, out = X, **params)
+        X.flush()
+        del X
+        os.replace(tmp, path)
+    finally:
+        if (os.path.isfile(tmp)):
+            os.remove(tmp)
+
+    evict(CACHE_SIZE, keep = path)
+
+    return path
+
+def cached(function, sources = [], mmap = False, **params):
+    """
+    Return a cached array, calculating it if needed.
+
+    Keyword arguments:
+    function -- the function returning the array, called as
+        function(*sources, **params).
+    sources -- the source file paths. (default = [])
+    mmap -- whether to memory map the cached file read-only.
+        (default = False)
+    """
+
+    path = cacheFile(function, sources, **params)
+
+    return np.load(path, mmap_mode = "r" if mmap else None)
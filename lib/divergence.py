@@ -0,0 +1,183 @@
+"""@package NMF-visualization
+
+Divergences between a matrix and its approximation.
+
+The divergences are evaluated over blocks of columns with in-place
+operations, so only a few block sized temporaries are allocated however
+large the matrices are, and the arguments are never modified. The sums are
+accumulated in double precision. The beta-divergence has exact forms for
+beta = 0 (Itakura-Saito), 1 (Kullback-Leibler) and 2 (Euclidean).
+"""
+
+import numpy as np
+
+EPS = 1e-32
+
+def chunkedSum(function, X, Y, axis = None, chunkSize = 1024):
+    """
+    Sum an element-wise function of two matrices over blocks of columns.
+
+    Keyword arguments:
+    function -- a function of blocks of X and Y returning a new array of
+        element-wise values.
+    X -- a matrix.
+    Y -- a matrix with the same shape.
+    axis -- the axis to sum over. (default = None)
+    chunkSize -- the number of columns per block. (default = 1024)
+
+    Returns:
+    c -- the sum.
+    """
+
+    X = np.asarray(X)
+    Y = np.asarray(Y)
+
+    if (X.ndim != 2):
+        return np.sum(function(X, Y), axis = axis, dtype = np.float64)
+
+    numColumns = X.shape[1]
+    if (axis == 0 or axis == -2):
+        c = np.empty(numColumns)
+    elif (axis is None):
+        c = 0.0
+    else:
+        c = np.zeros(X.shape[0])
+
+    for start in range(0, numColumns, chunkSize):
+        stop = min(start + chunkSize, numColumns)
+        d = function(X[:, start:stop], Y[:, start:stop])
+
+        if (axis == 0 or axis == -2):
+            c[start:stop] = np.sum(d, axis = 0, dtype = np.float64)
+        else:
+            c += np.sum(d, axis = axis, dtype = np.float64)
+
+    return c
+
+def squaredError(x, y):
+    """
+    Return (x - y)^2 element-wise.
+    """
+
+    d = np.subtract(x, y, dtype = np.result_type(x, y, np.float32))
+    d *= d
+
+    return d
+
+def logRatio(x, y, base = np.e):
+    """
+    Return log(x/y) element-wise, and zero where x is zero.
+    """
+
+    r = np.divide(x, np.maximum(y, EPS), dtype = np.result_type(x, y,
+                                                                np.float32))
+    np.log(r, out = r, where = r > 0)
+    if (base != np.e):
+        r /= np.log(base)
+
+    return r
+
+def klDivergence(x, y, base = np.e):
+    """
+    Return x log(x/y) - x + y element-wise.
+    """
+
+    d = logRatio(x, y, base)
+    d *= x
+    d -= x
+    d += y
+
+    return d
+
+def isDivergence(x, y):
+    """
+    Return x/y - log(x/y) - 1 element-wise.
+    """
+
+    r = np.divide(x, np.maximum(y, EPS), dtype = np.result_type(x, y,
+                                                                np.float32))
+    d = r - 1
+    d -= np.log(np.maximum(r, EPS))
+
+    return d
+
+def betaDivergence(X, Y, beta = 0.5, axis = None, chunkSize = 1024):
+    """
+    Return the beta-divergence for X and its
+    approximation.
+
+    Keyword arguments:
+    X -- a matrix.
+    Y -- X's approximation.
+    beta -- the beta parameter. (default = 0.5)
+    axis -- the axis to sum over. (default = None)
+    chunkSize -- the number of columns evaluated at once. (default = 1024)
+
+    Returns:
+    c -- the beta divergence.
+    """
+
+    if (beta == 2):
+        return 0.5*chunkedSum(squaredError, X, Y, axis, chunkSize)
+    elif (beta == 1):
+        return chunkedSum(klDivergence, X, Y, axis, chunkSize)
+    elif (beta == 0):
+        return chunkedSum(isDivergence, X, Y, axis, chunkSize)
+
+    def divergence(x, y):
+        if (beta < 1):
+            y = np.maximum(y, EPS)
+
+        # x^beta + (beta - 1) y^beta - beta x y^(beta - 1)
+        a = np.power(y, beta - 1, dtype = np.result_type(y, np.float32))
+        d = a*y
+        d *= beta - 1
+        a *= x
+        a *= beta
+        d -= a
+        d += np.power(x, beta, out = a)
+
+        return d
+
+    return chunkedSum(divergence, X, Y, axis, chunkSize)/(beta*(beta - 1))
+
+def frobenius(X, Y, axis = None, chunkSize = 1024):
+    """
+    Return the Frobenius norm for X and its
+    approximation.
+
+    Keyword arguments:
+    X -- a matrix.
+    Y -- X's approximation.
+    axis -- the axis to sum over. (default = None)
+    chunkSize -- the number of columns evaluated at once. (default = 1024)
+
+    Returns:
+    c -- the Frobenius norm.
+    """
+
+    return 0.5*chunkedSum(squaredError, X, Y, axis, chunkSize)
+
+def KLD(X, Y, axis = None, chunkSize = 1024):
+    """
+    Return the Kullback-Liebler divergence for X and its
+    approximation.
+
+    The logarithm is taken in base 10 as in earlier versions, entries of Y
+    equal to zero are treated as 1e-32 and entries of X equal to zero
+    contribute Y.
+
+    Keyword arguments:
+    X -- a matrix.
+    Y -- X's approximation.
+    axis -- the axis to sum over. (default = None)
+    chunkSize -- the number of columns evaluated at once. (default = 1024)
+
+    Returns:
+    c -- the Kullback-Liebler divergence.
+    """
+
+    def divergence(x, y):
+        return klDivergence(x, y, 10)
+
+    return chunkedSum(divergence, X, Y, axis, chunkSize)
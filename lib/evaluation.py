@@ -0,0 +1,216 @@
+"""@package NMF-visualization
+
+Functions for scoring transcriptions against ground truths.
+
+Frame-level and note onset precision, recall and F-measure are calculated
+for a sweep of activation thresholds at once. Activations are processed in
+chunks of frames, so memory does not depend on the length of the
+recording.
+"""
+
+import numpy as np
+import time
+
+from lib.utils import absMax
+
+def thresholdCounts(values, thresholds):
+    """
+    Count the values at or above each threshold.
+
+    Keyword arguments:
+    values -- an array of values.
+    thresholds -- the thresholds in increasing order.
+
+    Returns:
+    counts -- the number of values at or above each threshold.
+    """
+
+    k = np.searchsorted(thresholds, values.ravel(), side = "right")
+    counts = np.bincount(k, minlength = len(thresholds) + 1)
+
+    return values.size - np.cumsum(counts)[:-1]
+
+def intervalCounts(kLo, kHi, numThresholds):
+    """
+    Count the threshold index intervals covering each threshold index.
+
+    Keyword arguments:
+    kLo -- the first index of each interval.
+    kHi -- the index after each interval.
+    numThresholds -- the number of thresholds.
+
+    Returns:
+    counts -- the number of intervals covering each threshold index.
+    """
+
+    d = (np.bincount(kLo.ravel(), minlength = numThresholds + 1)
+         - np.bincount(kHi.ravel(), minlength = numThresholds + 1))
+
+    return np.cumsum(d)[:-1]
+
+def ratio(a, b):
+    """
+    Return a/b element-wise, or zero where b is zero.
+
+    Keyword arguments:
+    a -- the numerators.
+    b -- the denominators.
+    """
+
+    a, b = np.broadcast_arrays(np.asarray(a, dtype = float), b)
+
+    return np.divide(a, b, out = np.zeros(a.shape), where = b > 0)
+
+def fMeasure(precision, recall):
+    """
+    Return the F-measure, the harmonic mean of precision and recall.
+
+    Keyword arguments:
+    precision -- the precision.
+    recall -- the recall.
+    """
+
+    return ratio(2*precision*recall, precision + recall)
+
+def evaluate(H, T, thresholds = None, truthThreshold = 0.5, tolerance = 5,
+             chunkSize = 8192):
+    """
+    Score a transcription against a ground truth for a threshold sweep.
+
+    Activations are scaled by their maximum and a note is active in a frame
+    when its activation reaches the threshold. A predicted onset is correct
+    when a ground truth onset of the same note lies within the tolerance,
+    and a ground truth onset is detected when a predicted onset of the same
+    note lies within the tolerance.
+
+    Keyword arguments:
+    H -- the transcription, notes x frames.
+    T -- the ground truth, notes x frames.
+    thresholds -- the activation thresholds in increasing order.
+        (default = None, 0.01 to 1 in steps of 0.01)
+    truthThreshold -- the ground truth is active where it reaches this
+        fraction of its maximum. (default = 0.5)
+    tolerance -- the onset tolerance in frames. (default = 5)
+    chunkSize -- the number of frames processed at once. (default = 8192)
+
+    Returns:
+    result -- a dictionary with the thresholds and the frame and onset
+        precision, recall and F-measure for each threshold.
+    """
+
+    if (thresholds is None):
+        thresholds = np.linspace(0, 1, 101)[1:]
+    thresholds = np.asarray(thresholds)
+    K = len(thresholds)
+
+    numNotes = min(H.shape[0], T.shape[0])
+    numFrames = min(H.shape[1], T.shape[1])
+    scale = absMax(H)
+    scale = scale if (scale > 0) else 1
+    truthScale = truthThreshold*absMax(T)
+
+    tp = np.zeros(K, dtype = np.int64)
+    predicted = np.zeros(K, dtype = np.int64)
+    numTrue = 0
+    onsetMatched = np.zeros(K, dtype = np.int64)
+    onsetPredicted = np.zeros(K, dtype = np.int64)
+    onsetDetected = np.zeros(K, dtype = np.int64)
+    numOnsets = 0
+
+    for start in range(0, numFrames, chunkSize):
+        stop = min(start + chunkSize, numFrames)
+
+        # Extend the chunk by the tolerance and one previous frame for
+        # onsets.
+        a = max(0, start - tolerance - 1)
+        b = min(numFrames, stop + tolerance)
+        A = np.asarray(H[:numNotes, a:b], dtype = float)/scale
+        B = np.asarray(T[:numNotes, a:b]) > truthScale
+        core = slice(start - a, stop - a)
+
+        # Frame level.
+        Ac = A[:, core]
+        Bc = B[:, core]
+        tp += thresholdCounts(Ac[Bc], thresholds)
+        predicted += thresholdCounts(Ac, thresholds)
+        numTrue += np.count_nonzero(Bc)
+
+        # Onsets. A rising edge from lo to hi is an onset for thresholds in
+        # (lo, hi], i.e. threshold indices kLo to kHi - 1.
+        prev = np.zeros((numNotes, 1))
+        prevB = np.zeros((numNotes, 1), dtype = bool)
+        if (a > 0):
+            prev = A[:, :1]
+            prevB = B[:, :1]
+            A = A[:, 1:]
+            B = B[:, 1:]
+            core = slice(core.start - 1, core.stop - 1)
+        lo = np.concatenate((prev, A[:, :-1]), axis = 1)
+        kLo = np.searchsorted(thresholds, lo, side = "right")
+        kHi = np.searchsorted(thresholds, A, side = "right")
+        kHi = np.maximum(kLo, kHi)
+
+        onsets = B & ~np.concatenate((prevB, B[:, :-1]), axis = 1)
+
+        # Truth onsets within the tolerance of each frame.
+        near = onsets.copy()
+        for d in range(1, tolerance + 1):
+            near[:, d:] |= onsets[:, :-d]
+            near[:, :-d] |= onsets[:, d:]
+
+        kLoC = kLo[:, core]
+        kHiC = kHi[:, core]
+        onsetPredicted += intervalCounts(kLoC, kHiC, K)
+        nearC = near[:, core]
+        onsetMatched += intervalCounts(kLoC[nearC], kHiC[nearC], K)
+
+        # Detected truth onsets, the union of the nearby onset intervals.
+        notes, frames = np.nonzero(onsets[:, core])
+        frames += core.start
+        numOnsets += len(notes)
+        detected = np.zeros((len(notes), K), dtype = bool)
+        k = np.arange(0, K)
+        for d in range(-tolerance, tolerance + 1):
+            j = frames + d
+            valid = (j >= 0) & (j < A.shape[1])
+            j = np.clip(j, 0, A.shape[1] - 1)
+            l = np.where(valid, kLo[notes, j], 0).reshape((-1, 1))
+            h = np.where(valid, kHi[notes, j], 0).reshape((-1, 1))
+            detected |= (k >= l) & (k < h)
+        onsetDetected += np.count_nonzero(detected, axis = 0)
+
+    framePrecision = ratio(tp, predicted)
+    frameRecall = ratio(tp, numTrue)
+    onsetPrecision = ratio(onsetMatched, onsetPredicted)
+    onsetRecall = ratio(onsetDetected, numOnsets)
+
+    return {"thresholds": thresholds,
+            "framePrecision": framePrecision, "frameRecall": frameRecall,
+            "frameF": fMeasure(framePrecision, frameRecall),
+            "onsetPrecision": onsetPrecision, "onsetRecall": onsetRecall,
+            "onsetF": fMeasure(onsetPrecision, onsetRecall)}
+
+def evaluateFile(transcriptionPath, truthPath, **kwargs):
+    """
+    Score a transcription file against a ground truth file.
+
+    Keyword arguments:
+    transcriptionPath -- the transcription file.
+    truthPath -- the ground truth file.
+
+    Keyword arguments are passed to evaluate.
+
+    Returns:
+    result -- the result of evaluate, with the calculation time in s in
+        "time".
+    """
+
+    start = time.perf_counter()
+
+    H = np.load(transcriptionPath, mmap_mode = "r")
+    T = np.load(truthPath, mmap_mode = "r")
+    result = evaluate(H, T, **kwargs)
+
+    result["time"] = time.perf_counter() - start
+
+    return result
@@ -0,0 +1,155 @@
+"""@package NMF-visualization
+
+Render frame by frame visualizations to image sequences and videos.
+
+Frames are drawn directly on an Agg canvas without an interactive backend
+or event loop. Chunks of frames are rendered in parallel processes and the
+images are stitched into a GIF with Pillow or a video with ffmpeg.
+"""
+
+import math
+import numpy as np
+import os
+import shutil
+import subprocess
+import tempfile
+
+from concurrent.futures import ProcessPoolExecutor
+from matplotlib.backends.backend_agg import FigureCanvasAgg
+from matplotlib.figure import Figure
+from PIL import Image
+
+from lib.utils import absMax
+
+FRAME_NAME = "frame_%06d.png"
+
+def renderFrames(paths, scales, frames, directory, first = 0, labels = None,
+                 x = None, xlabel = "", hopLen = 10, offset = True,
+                 size = (6.4, 4.8), dpi = 100):
+    """
+    Render frames of arrays to PNG images.
+
+    Keyword arguments:
+    paths -- the array files, with frames as columns.
+    scales -- the value each array is divided by.
+    frames -- the frame indices to render.
+    directory -- the destination directory.
+    first -- the image number of the first frame. (default = 0)
+    labels -- the legend labels. (default = None)
+    x -- the x coordinates of the rows. (default = None)
+    xlabel -- the x axis label. (default = "")
+    hopLen -- the hop length in ms. (default = 10)
+    offset -- whether to offset each array by its index. (default = True)
+    size -- the figure size in inches. (default = (6.4, 4.8))
+    dpi -- the resolution. (default = 100)
+    """
+
+    plots = [np.load(path, mmap_mode = "r") for path in paths]
+    numComp = len(plots)
+    if (x is None):
+        x = np.arange(0, plots[0].shape[0])
+
+    fig = Figure(figsize = size, dpi = dpi)
+    canvas = FigureCanvasAgg(fig)
+    ax = fig.add_subplot()
+
+    lines = []
+    for j in range(numComp):
+        label = labels[j] if (labels) else None
+        line, = ax.plot(x, np.zeros(len(x)), label = label)
+        lines += [line]
+    time = ax.text(x[0], numComp if (offset) else 1, "")
+    if (labels and any(labels)):
+        ax.legend(loc = 1)
+    if (offset):
+        ax.set_ylim(-1, numComp + 1)
+        ax.set_yticklabels([])
+    else:
+        ax.set_ylim(0, 1.1)
+    ax.set_xlabel(xlabel)
+
+    for n, i in enumerate(frames):
+        for j in range(numComp):
+            y = plots[j][:, i]/scales[j]
+            lines[j].set_ydata(y + j if (offset) else y)
+        time.set_text("t = %.3g s" % (i*hopLen/1000))
+        canvas.draw()
+        image = Image.fromarray(np.asarray(canvas.buffer_rgba()))
+        image.convert("RGB").save(os.path.join(directory,
+                                               FRAME_NAME % (first + n)),
+                                  compress_level = 1)
+
+def exportAnimation(paths, savePath, fps = 25, hopLen = 10, numWorkers = None,
+                    **kwargs):
+    """
+    Export a frame by frame comparison of arrays.
+
+    Keyword arguments:
+    paths -- the array files, with frames as columns.
+    savePath -- a directory for a PNG sequence, or a .gif or video file.
+    fps -- the output frame rate, frames are decimated to match it.
+        (default = 25)
+    hopLen -- the hop length in ms. (default = 10)
+    numWorkers -- the number of worker processes. (default = None, the
+        number of CPUs)
+
+    Keyword arguments are passed to renderFrames.
+
+    Raises a ValueError if the arrays have no frames, or before rendering
+    if ffmpeg is needed for the video format and is not installed.
+    """
+
+    numFrames = min(np.load(path, mmap_mode = "r").shape[1] for path in paths)
+    scales = [absMax(np.load(path, mmap_mode = "r")) for path in paths]
+
+    if (numFrames == 0):
+        raise ValueError("There are no frames to export.")
+
+    # At least the first frame is rendered for arrays shorter than one
+    # output frame.
+    duration = numFrames*hopLen/1000
+    numOutput = max(1, math.floor(duration*fps))
+    frames = (np.arange(0, numOutput)*1000/(fps*hopLen)).astype(int)
+
+    if (numWorkers is None):
+        numWorkers = os.cpu_count()
+
+    extension = os.path.splitext(savePath)[1].lower()
+    if (not extension in ("", ".gif") and shutil.which("ffmpeg") is None):
+        raise ValueError("ffmpeg is needed to write %s files." % extension)
+
+    if (extension == ""):
+        directory = savePath
+        os.makedirs(directory, exist_ok = True)
+    else:
+        tmp = tempfile.TemporaryDirectory()
+        directory = tmp.name
+
+    # Render chunks of consecutive frames in parallel.
+    chunkSize = math.ceil(len(frames)/numWorkers)
+    with ProcessPoolExecutor(max_workers = numWorkers) as executor:
+        futures = [executor.submit(renderFrames, paths, scales,
+                                   frames[i:i + chunkSize], directory, i,
+                                   hopLen = hopLen, **kwargs)
+                   for i in range(0, len(frames), chunkSize)]
+        for future in futures:
+            future.result()
+
+    if (extension == ""):
+        return
+
+    images = [os.path.join(directory, FRAME_NAME % i)
+              for i in range(len(frames))]
+
+    if (extension == ".gif"):
+        first = Image.open(images[0])
+        first.save(savePath, save_all = True,
+                   append_images = (Image.open(image) for image in images[1:]),
+                   duration = 1000/fps, loop = 0)
+    else:
+        subprocess.run(["ffmpeg", "-y", "-loglevel", "error",
+                        "-framerate", str(fps),
+                        "-i", os.path.join(directory, FRAME_NAME),
+                        "-pix_fmt", "yuv420p", savePath], check = True)
+
+    tmp.cleanup()
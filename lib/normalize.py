@@ -5,26 +5,179 @@ Functions for normalizing matrices
 
 import numpy as np
 
-def maxNormalize(X, axis = None):
+def divide(X, d, inPlace = False, dtype = None):
+    """
+    Divide X by broadcast normalization factors.
 
-    if (axis is None):
-        return X/np.max(X)
+    Factors equal to zero, e.g. of silent frequency bins, are treated as
+    one so that zero-energy slices stay zero instead of becoming NaN.
 
-    return np.apply_along_axis(maxNormalize, axis, X)
+    Keyword arguments:
+    X -- a matrix.
+    d -- the normalization factors, broadcastable to X.
+    inPlace -- whether to overwrite X, if it has the requested precision.
+        (default = False)
+    dtype -- the precision of the result. (default = None, the precision
+        of X, or double for integer X)
 
-def sumNormalize(X, axis = None):
+    Returns:
+    X -- the normalized matrix.
+    """
 
-    if (axis is None):
-        return X/np.sum(X)
+    if (dtype is None):
+        dtype = X.dtype if (X.dtype.kind == "f") else np.float64
 
-    return np.apply_along_axis(sumNormalize, axis, X)
+    d = np.where(d == 0, 1, d)
 
-def RMSnormalize(X, axis = None):
+    if (inPlace and X.dtype == dtype):
+        out = X
+    else:
+        out = np.empty(X.shape, dtype = dtype)
 
-    if (axis is None):
-        N = X.size
-        rms = np.sqrt(np.sum(abs(np.square(X)))/N)
+    return np.divide(X, d, out = out)
 
-        return X/np.max(X)
+def maxNormalize(X, axis = None, inPlace = False, dtype = None):
+    """
+    Normalize a matrix by its maximum.
 
-    return np.apply_along_axis(RMSnormalize, axis, X)
+    Keyword arguments:
+    X -- a matrix.
+    axis -- normalize each slice along this axis separately, None
+        normalizes the whole matrix. (default = None)
+    inPlace -- whether to overwrite X. (default = False)
+    dtype -- the precision of the result. (default = None)
+    """
+
+    m = np.max(X, axis = axis, keepdims = True)
+
+    return divide(X, m, inPlace, dtype)
+
+def sumNormalize(X, axis = None, inPlace = False, dtype = None):
+    """
+    Normalize a matrix by its sum.
+
+    Keyword arguments:
+    X -- a matrix.
+    axis -- normalize each slice along this axis separately, None
+        normalizes the whole matrix. (default = None)
+    inPlace -- whether to overwrite X. (default = False)
+    dtype -- the precision of the result. (default = None)
+    """
+
+    s = np.sum(X, axis = axis, keepdims = True)
+
+    return divide(X, s, inPlace, dtype)
+
+def RMSnormalize(X, axis = None, inPlace = False, dtype = None):
+    """
+    Normalize a matrix by its root mean square.
+
+    Keyword arguments:
+    X -- a matrix.
+    axis -- normalize each slice along this axis separately, None
+        normalizes the whole matrix. (default = None)
+    inPlace -- whether to overwrite X. (default = False)
+    dtype -- the precision of the result. (default = None)
+    """
+
+    rms = np.sqrt(np.mean(np.square(abs(X)), axis = axis, keepdims = True))
+
+    return divide(X, rms, inPlace, dtype)
+
+def streamNormalize(blocks, norm = "max", dtype = None):
+    """
+    Normalize the rows of a matrix streamed as blocks of columns.
+
+    Each block is normalized with the running statistic of each row over
+    all blocks so far, so the last block is normalized as by the
+    corresponding function with axis = 1.
+
+    Keyword arguments:
+    blocks -- an iterable of consecutive column blocks.
+    norm -- the normalization name, "max", "rms" or "sum".
+        (default = "max")
+    dtype -- the precision of the result. (default = None)
+
+    Yields:
+    X -- the normalized blocks.
+    """
+
+    norm = norm.lower()
+    stat = None
+    count = 0
+
+    for X in blocks:
+        if (norm == "max"):
+            m = np.max(X, axis = 1, keepdims = True)
+            stat = m if (stat is None) else np.maximum(stat, m)
+            d = stat
+        elif (norm == "sum"):
+            s = np.sum(X, axis = 1, keepdims = True)
+            stat = s if (stat is None) else stat + s
+            d = stat
+        elif (norm == "rms"):
+            s = np.sum(np.square(abs(X)), axis = 1, keepdims = True)
+            stat = s if (stat is None) else stat + s
+            count += X.shape[1]
+            d = np.sqrt(stat/count)
+        else:
+            yield X
+            continue
+
+        yield divide(X, d, dtype = dtype)
+
+def normalizationFactors(X, norm = "max", blockSize = 4096):
+    """
+    Return the factors normalizing the rows of a matrix, reading a window
+    of columns at a time.
+
+    Keyword arguments:
+    X -- the matrix, e.g. a memory mapped array.
+    norm -- the normalization name, "max", "rms" or "sum".
+        (default = "max")
+    blockSize -- the number of columns per window. (default = 4096)
+
+    Returns:
+    d -- a column of factors, such that divide(X, d) normalizes X as the
+        corresponding function with axis = 1, or None for any other name.
+    """
+
+    norm = norm.lower()
+    if (not norm in ["max", "rms", "sum"]):
+        return None
+
+    d = np.zeros((X.shape[0], 1))
+    for i in range(0, X.shape[1], blockSize):
+        block = X[:, i:i + blockSize]
+        if (norm == "max"):
+            np.maximum(d, np.max(block, axis = 1, keepdims = True), out = d)
+        elif (norm == "sum"):
+            d += np.sum(block, axis = 1, keepdims = True)
+        else:
+            d += np.sum(np.square(abs(block)), axis = 1, keepdims = True)
+
+    if (norm == "rms"):
+        d = np.sqrt(d/X.shape[1])
+
+    return d
+
+def getNormalization(norm):
+    """
+    Return the normalization function with a given name.
+
+    Keyword arguments:
+    norm -- the normalization name, "max", "rms" or "sum".
+
+    Returns:
+    f -- the normalization function, or None for any other name.
+    """
+
+    norm = norm.lower()
+    if (norm == "max"):
+        return maxNormalize
+    elif (norm == "rms"):
+        return RMSnormalize
+    elif (norm == "sum"):
+        return sumNormalize
+
+    return None
@@ -0,0 +1,173 @@
+"""@package NMF-visualization
+
+Multi-resolution pyramids of activation matrices.
+
+Each level of a pyramid reduces groups of columns of the previous level to
+their minimum, maximum and mean. The levels are stored as .npy files in a
+directory next to the activation file and are memory mapped when read, so
+a window of a long recording only reads the columns shown at its zoom
+level.
+"""
+
+import json
+import math
+import numpy as np
+import os
+
+STATS = ["min", "max", "mean"]
+
+def pyramidPath(path):
+    """
+    Return the pyramid directory of an activation file.
+
+    Keyword arguments:
+    path -- the activation file path.
+    """
+
+    if (path.endswith(".npy")):
+        path = path[:-4]
+
+    return path + ".pyramid/"
+
+def levelPath(path, level, stat):
+    """
+    Return the file of one statistic of a pyramid level.
+
+    Keyword arguments:
+    path -- the activation file path.
+    level -- the level, 1 or higher.
+    stat -- the statistic, one of STATS.
+    """
+
+    return pyramidPath(path) + "%d_%s.npy" % (level, stat)
+
+def loadPyramidInfo(path):
+    """
+    Return the description of an activation file's pyramid.
+
+    Keyword arguments:
+    path -- the activation file path.
+
+    Returns:
+    info -- a dictionary with the reduction factor, number of levels and
+        number of frames, or None if the pyramid is missing or older than
+        the activation file.
+    """
+
+    infoPath = pyramidPath(path) + "info.json"
+    if (not os.path.isfile(infoPath)
+        or os.path.getmtime(infoPath) < os.path.getmtime(path)):
+        return None
+
+    with open(infoPath, "r") as f:
+        return json.load(f)
+
+def buildPyramid(path, factor = 4, minFrames = 1024, blockSize = 2**16):
+    """
+    Build the pyramid of an activation file.
+
+    The activation file and each level are processed in blocks of columns,
+    so memory does not depend on the length of the recording.
+
+    Keyword arguments:
+    path -- the activation file path.
+    factor -- the number of columns reduced to one per level. (default = 4)
+    minFrames -- levels are added until a level has at most this many
+        columns. (default = 1024)
+    blockSize -- the number of columns read at once. (default = 2**16)
+
+    Returns:
+    info -- the description of the pyramid.
+    """
+
+    H = np.load(path, mmap_mode = "r")
+    numNotes, numFrames = H.shape
+    os.makedirs(pyramidPath(path), exist_ok = True)
+
+    blockSize = max(factor, blockSize - blockSize%factor)
+    source = [H, H, H]
+    step = 1
+    n = numFrames
+    level = 0
+
+    while (n > minFrames):
+        level += 1
+        m = math.ceil(n/factor)
+        levels = [np.lib.format.open_memmap(levelPath(path, level, stat),
+                                            mode = "w+", dtype = H.dtype,
+                                            shape = (numNotes, m))
+                  for stat in STATS]
+
+        for start in range(0, n, blockSize):
+            stop = min(start + blockSize, n)
+            groups = np.arange(0, stop - start, factor)
+            i = start//factor
+            j = i + len(groups)
+
+            # Number of frames covered by each source column.
+            counts = np.minimum(step, numFrames - np.arange(start, stop)*step)
+
+            levels[0][:, i:j] = np.minimum.reduceat(source[0][:, start:stop],
+                                                    groups, axis = 1)
+            levels[1][:, i:j] = np.maximum.reduceat(source[1][:, start:stop],
+                                                    groups, axis = 1)
+            sums = np.add.reduceat(source[2][:, start:stop]*counts, groups,
+                                   axis = 1)
+            levels[2][:, i:j] = sums/np.add.reduceat(counts, groups)
+
+        for X in levels:
+            X.flush()
+
+        source = levels
+        step *= factor
+        n = m
+
+    info = {"factor": factor, "levels": level, "frames": numFrames}
+    with open(pyramidPath(path) + "info.json", "w") as f:
+        json.dump(info, f)
+
+    return info
+
+def readWindow(path, start, stop, maxColumns = 2048, stat = "max",
+               info = None):
+    """
+    Read a window of frames at the coarsest level with enough detail.
+
+    Keyword arguments:
+    path -- the activation file path.
+    start -- the first frame of the window.
+    stop -- the frame after the window.
+    maxColumns -- the maximum number of columns to read. (default = 2048)
+    stat -- the statistic to read, one of STATS. (default = "max")
+    info -- the pyramid description, loaded if not given.
+        (default = None)
+
+    Returns:
+    X -- the columns covering the window, at least one.
+    first -- the frame of the first column.
+    step -- the number of frames per column.
+    """
+
+    if (info is None):
+        info = loadPyramidInfo(path)
+
+    # Windows past either end are clamped to the first or last frame.
+    numFrames = info["frames"]
+    start = min(max(0, int(start)), numFrames - 1)
+    stop = max(start + 1, min(numFrames, int(math.ceil(stop))))
+
+    level = 0
+    while (level < info["levels"]
+           and (stop - start)/info["factor"]**level > maxColumns):
+        level += 1
+
+    step = info["factor"]**level
+    i = start//step
+    j = max(i + 1, math.ceil(stop/step))
+
+    if (level == 0):
+        X = np.load(path, mmap_mode = "r")
+    else:
+        X = np.load(levelPath(path, level, stat), mmap_mode = "r")
+
+    return np.array(X[:, i:j]), i*step, step
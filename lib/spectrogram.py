@@ -34,6 +34,71 @@ def magnitudeSpectrogram(x, Fs = 44100, windowLen = 46, hopLen = 10,
     S = librosa.stft(x, n_fft = fftSize, hop_length = hopSize, 
                      win_length = windowSize, window = window, 
                      pad_mode = padMode, center = False)
-    S, phase = librosa.magphase(S)
     
-    return S
+    # Only the magnitude is needed, so no phase matrix is formed.
+    return np.abs(S)
+
+def audioSpectrogram(path, Fs = 44100, windowLen = 46, hopLen = 10,
+                     fftSize = 2048, window = "hamming", padMode = "constant"):
+    """
+    Load an audio file and calculate its magnitude spectrogram.
+    
+    Keyword arguments:
+    path -- the audio file path.
+    Fs -- sampling frequency. (default = 44100)
+    windowLen -- the window length in ms. (default = 46)
+    hopLen -- the hop length in ms. (default = 10)
+    fftSize -- the FFT size. (default = 2048)
+    window -- the window to use. (default = "hamming")
+    padMode -- the pad mode to use. (default = "constant")
+    
+    Returns:
+    S -- the magnitude spectrogram of the file.
+    """
+    
+    x, Fs = librosa.load(path, sr = Fs, mono = True)
+    
+    return magnitudeSpectrogram(x, Fs, windowLen, hopLen, fftSize, window,
+                                padMode)
+
+def streamMagnitudeSpectrogram(blocks, Fs = 44100, windowLen = 46,
+                               hopLen = 10, fftSize = 2048,
+                               window = "hamming", **kwargs):
+    """
+    Calculate a magnitude spectrogram from a stream of audio blocks.
+    
+    Frames are computed as in magnitudeSpectrogram and the samples
+    overlapping the next block are kept between blocks, so the
+    concatenated output equals the spectrogram of the whole signal.
+    
+    Keyword arguments:
+    blocks -- an iterable of consecutive signal blocks.
+    Fs -- sampling frequency. (default = 44100)
+    windowLen -- the window length in ms. (default = 46)
+    hopLen -- the hop length in ms. (default = 10)
+    fftSize -- the FFT size. (default = 2048)
+    window -- the window to use. (default = "hamming")
+    
+    Yields:
+    S -- the magnitude spectrogram columns completed by each block.
+    """
+    
+    windowSize = math.floor(windowLen*Fs/1000)
+    hopSize = math.floor(hopLen*Fs/1000)
+    
+    w = librosa.filters.get_window(window, windowSize, fftbins = True)
+    w = librosa.util.pad_center(w, size = fftSize).reshape((fftSize, 1))
+    
+    buffer = np.zeros(0)
+    for x in blocks:
+        buffer = np.concatenate((buffer, x))
+        if (len(buffer) < fftSize):
+            continue
+        
+        frames = librosa.util.frame(buffer, frame_length = fftSize,
+                                    hop_length = hopSize)
+        numFrames = frames.shape[1]
+        S = abs(np.fft.rfft(w*frames, axis = 0))
+        buffer = buffer[numFrames*hopSize:]
+        
+        yield S
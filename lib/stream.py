@@ -0,0 +1,145 @@
+"""@package NMF-visualization
+
+Functions for transcribing audio streams block by block.
+"""
+
+import math
+import numpy as np
+import soundfile as sf
+
+from lib.NMF import fixedNMF
+from lib.normalize import streamNormalize
+from lib.spectrogram import streamMagnitudeSpectrogram
+
+def audioBlocks(path, blockLen = 10, Fs = 44100):
+    """
+    Read an audio file block by block.
+
+    Keyword arguments:
+    path -- the audio file path.
+    blockLen -- the block length in ms. (default = 10)
+    Fs -- the expected sampling frequency. (default = 44100)
+
+    Yields:
+    x -- consecutive mono signal blocks.
+    """
+
+    info = sf.info(path)
+    if (info.samplerate != Fs):
+        raise ValueError("%s has sampling frequency %d, expected %d."
+                         % (path, info.samplerate, Fs))
+
+    blockSize = max(1, math.floor(blockLen*Fs/1000))
+    for x in sf.blocks(path, blocksize = blockSize, dtype = "float32",
+                       always_2d = True):
+        yield np.mean(x, axis = 1)
+
+def numStreamFrames(path, Fs = 44100, hopLen = 10, fftSize = 2048,
+                    **kwargs):
+    """
+    Return the number of spectrogram frames a stream of a file yields.
+
+    Keyword arguments:
+    path -- the audio file path.
+    Fs -- sampling frequency. (default = 44100)
+    hopLen -- the hop length in ms. (default = 10)
+    fftSize -- the FFT size. (default = 2048)
+    """
+
+    numSamples = sf.info(path).frames
+    hopSize = math.floor(hopLen*Fs/1000)
+
+    if (numSamples < fftSize):
+        return 0
+
+    return 1 + (numSamples - fftSize)//hopSize
+
+def spectrogramFile(audioPath, savePath, Fs = 44100, blockLen = 10000,
+                    fftSize = 2048, dtype = np.float32, **kwargs):
+    """
+    Calculate the magnitude spectrogram of an audio file into a .npy file.
+
+    The audio is read block by block and the spectrogram columns are
+    written to a memory mapped file as they are completed, so memory does
+    not depend on the length of the recording. The result equals
+    audioSpectrogram for files at the requested sampling frequency.
+
+    Keyword arguments:
+    audioPath -- the audio file path.
+    savePath -- the .npy file to write.
+    Fs -- the sampling frequency of the file. (default = 44100)
+    blockLen -- the audio block length in ms. (default = 10000)
+    fftSize -- the FFT size. (default = 2048)
+    dtype -- the precision of the file. (default = np.float32)
+
+    Keyword arguments are passed to streamMagnitudeSpectrogram.
+
+    Returns:
+    S -- the memory mapped spectrogram.
+    """
+
+    # Check the sampling frequency before creating the file.
+    info = sf.info(audioPath)
+    if (info.samplerate != Fs):
+        raise ValueError("%s has sampling frequency %d, expected %d."
+                         % (audioPath, info.samplerate, Fs))
+
+    numFrames = numStreamFrames(audioPath, Fs, fftSize = fftSize, **kwargs)
+    S = np.lib.format.open_memmap(savePath, mode = "w+", dtype = dtype,
+                                  shape = (1 + fftSize//2, numFrames))
+
+    i = 0
+    for X in streamMagnitudeSpectrogram(audioBlocks(audioPath, blockLen, Fs),
+                                        Fs, fftSize = fftSize, **kwargs):
+        S[:, i:i + X.shape[1]] = X
+        i += X.shape[1]
+    S.flush()
+
+    return S
+
+def streamTranscription(blocks, W, Fs = 44100, threshold = 0.001,
+                        iterations = 20, seed = 314, warmStart = False,
+                        norm = None, **kwargs):
+    """
+    Transcribe a stream of audio blocks with a fixed dictionary.
+
+    Only the samples overlapping the next frame are kept between blocks,
+    so memory does not grow with the length of the stream.
+
+    Keyword arguments:
+    blocks -- an iterable of consecutive signal blocks.
+    W -- the known dictionary.
+    Fs -- sampling frequency. (default = 44100)
+    threshold -- the cost threshold. (default = 0.001)
+    iterations -- the maximum number of iterations. (default = 20)
+    seed -- the random initialization seed. (default = 314)
+    warmStart -- whether to initialize each block with the last
+        activations of the previous block. (default = False)
+    norm -- the normalization of the frequency bins, using their running
+        statistics. (default = None)
+
+    Keyword arguments are passed to streamMagnitudeSpectrogram.
+
+    Yields:
+    H -- the activations of the frames completed by each block.
+    """
+
+    rng = np.random.default_rng(seed)
+    numBins, numNotes = W.shape
+    h = None
+
+    spectrogram = streamMagnitudeSpectrogram(blocks, Fs, **kwargs)
+    if (not norm is None):
+        spectrogram = streamNormalize(spectrogram, norm)
+
+    for V in spectrogram:
+        if (h is None):
+            H = 1 - rng.random((numNotes, V.shape[1]))
+        else:
+            H = np.repeat(h.reshape((numNotes, 1)), V.shape[1], axis = 1)
+        H, _ = fixedNMF(V, H, W, threshold, iterations)
+
+        if (warmStart):
+            h = np.maximum(H[:, -1], np.finfo(float).eps)
+
+        yield H
@@ -3,6 +3,7 @@
 Utility functions.
 """
 
+import numpy as np
 import os
 
 from pathlib import Path
@@ -17,3 +18,62 @@ def createDir(path):
     
     dirPath = os.path.dirname(path)
     Path(dirPath).mkdir(parents = True, exist_ok = True)
+
+def findFile(path, directories = [], extension = ".npy"):
+    """
+    Return the first existing file matching a path.
+    
+    The path is tried as is and with the extension appended, first on its
+    own and then in each of the directories.
+    
+    Keyword arguments:
+    path -- the path to look for.
+    directories -- directories to look in. (default = [])
+    extension -- the file extension to try. (default = ".npy")
+    
+    Returns:
+    path -- the existing file path, or None if none exist.
+    """
+    
+    for directory in [""] + list(directories):
+        for candidate in [directory + path, directory + path + extension]:
+            if (os.path.isfile(candidate)):
+                return candidate
+    
+    return None
+
+def loadArray(path, directories = [], mmap = True):
+    """
+    Load an array file found with findFile.
+    
+    Keyword arguments:
+    path -- the path to look for.
+    directories -- directories to look in. (default = [])
+    mmap -- whether to memory map the file read-only instead of reading
+        it into memory. (default = True)
+    
+    Returns:
+    X -- the array, or None if no file was found.
+    """
+    
+    path = findFile(path, directories)
+    if (path is None):
+        return None
+    
+    return np.load(path, mmap_mode = "r" if mmap else None)
+
+def absMax(X, blockSize = 4096):
+    """
+    Return the maximum absolute value of a matrix, reading a window of
+    columns at a time.
+    
+    Keyword arguments:
+    X -- the matrix, e.g. a memory mapped array.
+    blockSize -- the number of columns per window. (default = 4096)
+    """
+    
+    m = 0
+    for i in range(0, X.shape[1], blockSize):
+        m = max(m, np.max(abs(X[:, i:i + blockSize])))
+    
+    return m
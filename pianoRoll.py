@@ -0,0 +1,105 @@
+"""@package NMF-visualization
+
+Show piano roll overviews of NMF transcriptions.
+"""
+
+import argparse
+import matplotlib.pyplot as plt
+import numpy as np
+
+from lib.pyramid import buildPyramid
+from lib.pyramid import loadPyramidInfo
+from lib.pyramid import readWindow
+from lib.utils import findFile
+
+NMF_PATH = "data/NMFs/"
+TRUTH_PATH = "data/truths/"
+
+if (__name__ == "__main__"):
+
+    parser = argparse.ArgumentParser("Show a piano roll of a transcription.")
+    parser.add_argument("transcription", help = "The transcription file.",
+                        type = str)
+    parser.add_argument("-t", "--truth",
+                        help = "A ground truth file to outline. "
+                        + "(default = None)",
+                        type = str, default = None, dest = "truth")
+    parser.add_argument("-m", "--minNote",
+                        help = "MIDI number of the lowest note bin."
+                        + "(default = 0)",
+                        type = int, default = 0, dest = "minNote")
+    parser.add_argument("--hop",
+                        help = "The hop length in ms. (default = 10)",
+                        type = int, default = 10, dest = "hopLen")
+    parser.add_argument("-s", "--stat",
+                        help = "The statistic shown when zoomed out, 'max', "
+                        + "'mean' or 'min'. (default = 'max')",
+                        type = str, default = "max", dest = "stat")
+    args = parser.parse_args()
+
+    paths = []
+    for path in [args.transcription, args.truth]:
+        if (path is None):
+            continue
+        found = findFile(path, [NMF_PATH, TRUTH_PATH])
+        if (found is None):
+            print ("Could not load %s!" % path)
+            raise SystemExit()
+        paths += [found]
+
+    # Build missing or outdated pyramids.
+    infos = []
+    for path in paths:
+        info = loadPyramidInfo(path)
+        if (info is None):
+            print ("Building pyramid for %s." % path)
+            info = buildPyramid(path)
+        infos += [info]
+
+    numNotes = np.load(paths[0], mmap_mode = "r").shape[0]
+    numFrames = infos[0]["frames"]
+    seconds = args.hopLen/1000
+    notes = np.arange(0, numNotes) + args.minNote
+
+    fig, ax = plt.subplots()
+    image = ax.imshow(np.zeros((numNotes, 1)), origin = "lower",
+                      aspect = "auto", interpolation = "nearest",
+                      cmap = "Greys")
+    outlines = []
+    ax.set_xlim(0, numFrames*seconds)
+    ax.set_ylim(args.minNote - 0.5, args.minNote + numNotes - 0.5)
+    ax.set_autoscale_on(False)
+    ax.set_xlabel("Time (s)")
+    ax.set_ylabel("Note (MIDI)")
+
+    def update(ax):
+        start, stop = ax.get_xlim()
+        start = start/seconds
+        stop = stop/seconds
+        maxColumns = 2*fig.get_size_inches()[0]*fig.dpi
+
+        X, first, step = readWindow(paths[0], start, stop, maxColumns,
+                                    args.stat, infos[0])
+        image.set_data(X)
+        image.set_clim(0, max(np.max(X), np.finfo(float).eps))
+        image.set_extent((first*seconds, (first + X.shape[1]*step)*seconds,
+                          args.minNote - 0.5, args.minNote + numNotes - 0.5))
+
+        if (len(paths) > 1):
+            for outline in outlines:
+                outline.remove()
+            outlines.clear()
+
+            T, first, step = readWindow(paths[1], start, stop, maxColumns,
+                                        "max", infos[1])
+            if (T.shape[1] > 1):
+                t = (first + (np.arange(0, T.shape[1]) + 0.5)*step)*seconds
+                outlines.append(ax.contour(t, notes, T > 0.5, levels = [0.5],
+                                           colors = "r", linewidths = 0.8))
+
+        fig.canvas.draw_idle()
+
+    ax.callbacks.connect("xlim_changed", update)
+    update(ax)
+
+    plt.show()
@@ -0,0 +1,118 @@
+"""@package NMF-visualization
+
+Calculate NMF transcriptions from an audio stream.
+"""
+
+import argparse
+import numpy as np
+import soundfile as sf
+
+from lib.stream import audioBlocks
+from lib.stream import numStreamFrames
+from lib.stream import streamTranscription
+from lib.utils import createDir
+
+AUDIO_PATH = "data/audio/"
+DICTIONARY_PATH = "data/dictionaries/"
+NMF_PATH = "data/NMFs/"
+
+if (__name__ == "__main__"):
+
+    parser = argparse.ArgumentParser("Calculate an NMF transcription from "
+                                     + "an audio stream.")
+    parser.add_argument("excerpt", help = "The excerpt audio file.", type = str)
+    parser.add_argument("dictionary", help = "The instrument dictionary file.",
+                        type = str)
+    parser.add_argument("--fs",
+                        help = "The sampling frequency. (default = 44100)",
+                        type = int, default = 44100, dest = "Fs")
+    parser.add_argument("--hop",
+                        help = "The hop length in ms. (default = 10)",
+                        type = int, default = 10, dest = "hopLen")
+    parser.add_argument("--block",
+                        help = "The audio block length in ms. (default = 10)",
+                        type = int, default = 10, dest = "blockLen")
+    parser.add_argument("--norm",
+                        help = "The spectrogram normalization, using the "
+                        + "running statistics of each bin. (default = 'max')",
+                        type = str, default = "max", dest = "norm")
+    parser.add_argument("--warm",
+                        help = "Initialize each block with the activations "
+                        + "of the previous block.", default = False,
+                        action = "store_true", dest = "warmStart")
+    parser.add_argument("-d",
+                        help = "The destination file. (default = None)",
+                        type = str, default = None, dest = "saveAs")
+    args = parser.parse_args()
+
+    # Find audio.
+    path = args.excerpt
+    for audioPath in [path, path + ".wav", AUDIO_PATH + path,
+                      AUDIO_PATH + path + ".wav"]:
+        try:
+            numFrames = numStreamFrames(audioPath, args.Fs, args.hopLen)
+            break
+        except:
+            pass
+    else:
+        print ("Could not load audio file!")
+        raise SystemExit()
+
+    # Check the sampling frequency before creating the destination file.
+    Fs = sf.info(audioPath).samplerate
+    if (Fs != args.Fs):
+        print ("%s has sampling frequency %d, expected %d!"
+               % (audioPath, Fs, args.Fs))
+        raise SystemExit()
+
+    # Load dictionary.
+    path = args.dictionary
+    while (True):
+        try:
+            W = np.load(path)
+            break
+        except:
+            pass
+
+        try:
+            W = np.load(path + ".npy")
+            break
+        except:
+            pass
+
+        try:
+            W = np.load(DICTIONARY_PATH + path)
+            break
+        except:
+            pass
+
+        try:
+            W = np.load(DICTIONARY_PATH + path + ".npy")
+            break
+        except:
+            pass
+
+        print ("Could not load dictionary file!")
+        raise SystemExit()
+
+    numBins, numNotes = W.shape
+
+    path = args.excerpt
+    if (args.saveAs is None):
+        path = NMF_PATH + path + ".npy"
+    else:
+        path = args.saveAs
+    createDir(path)
+
+    # Write activations as they are calculated.
+    H = np.lib.format.open_memmap(path, mode = "w+", shape = (numNotes,
+                                                              numFrames))
+    blocks = audioBlocks(audioPath, args.blockLen, args.Fs)
+    i = 0
+    for h in streamTranscription(blocks, W, args.Fs,
+                                 warmStart = args.warmStart,
+                                 norm = args.norm,
+                                 hopLen = args.hopLen):
+        H[:, i:i + h.shape[1]] = h
+        i += h.shape[1]
+    H.flush()
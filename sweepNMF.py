@@ -0,0 +1,205 @@
+"""@package NMF-visualization
+
+Sweep NMF parameters over a grid in parallel.
+
+Every combination of excerpt, normalization, cost, rank and number of
+iterations is factorized on a process pool and the reconstruction errors
+are appended to a tab separated table as the jobs finish. Jobs already in
+the table are skipped, so an interrupted sweep resumes where it stopped.
+"""
+
+import argparse
+import csv
+import itertools
+import numpy as np
+import os
+import time
+
+from concurrent.futures import ProcessPoolExecutor
+from concurrent.futures import as_completed
+
+from lib.NMF import betaDivergence
+from lib.NMF import frobenius
+from lib.NMF import KLD
+from lib.NMF import NMF
+from lib.cache import cacheFile
+from lib.normalize import getNormalization
+from lib.spectrogram import audioSpectrogram
+from lib.utils import createDir
+from lib.utils import findFile
+
+AUDIO_PATH = "data/audio/"
+SPECTROGRAM_PATH = "data/spectrograms/"
+SWEEP_PATH = "data/sweeps/sweep.tsv"
+
+COSTS = ["frobenius", "kld", "beta"]
+PARAMETERS = ["excerpt", "norm", "cost", "beta", "rank", "iterations"]
+ERRORS = ["frobenius", "betaDivergence", "KLD"]
+COLUMNS = PARAMETERS + ERRORS + ["time"]
+
+def costBeta(cost, beta):
+    """
+    Return the beta of the beta-divergence a cost corresponds to.
+
+    Keyword arguments:
+    cost -- the cost name, "frobenius", "kld" or "beta".
+    beta -- the beta of the "beta" cost.
+    """
+
+    cost = cost.lower()
+    if (cost == "frobenius"):
+        return 2
+    elif (cost == "kld"):
+        return 1
+
+    return beta
+
+def jobKey(job):
+    """
+    Return a string identifying a job's parameters.
+
+    Keyword arguments:
+    job -- the job dictionary.
+    """
+
+    return "\t".join(str(job[parameter]) for parameter in PARAMETERS)
+
+def runJob(job):
+    """
+    Factorize an excerpt with one set of parameters.
+
+    The spectrogram is memory mapped read-only, so the workers sweeping the
+    same excerpt share it.
+
+    Keyword arguments:
+    job -- the job dictionary, with the spectrogram path in "spectrogram".
+
+    Returns:
+    job -- the job dictionary with the reconstruction errors and the
+        calculation time in s.
+    """
+
+    start = time.perf_counter()
+
+    S = np.load(job["spectrogram"], mmap_mode = "r")
+    normalization = getNormalization(job["norm"])
+    V = S if (normalization is None) else normalization(S, axis = 1)
+
+    H, W = NMF(V, k = job["rank"], iterations = job["iterations"],
+               beta = costBeta(job["cost"], job["beta"]))
+
+    # The reconstruction is formed once for all errors.
+    Vestimate = np.matmul(W, H)
+    result = dict(job)
+    result["frobenius"] = frobenius(V, Vestimate)
+    result["betaDivergence"] = betaDivergence(V, Vestimate)
+    result["KLD"] = KLD(V, Vestimate)
+    result["time"] = time.perf_counter() - start
+    del result["spectrogram"]
+
+    return result
+
+def readTable(path):
+    """
+    Return the keys of the jobs already in a results table.
+
+    Keyword arguments:
+    path -- the table path.
+    """
+
+    if (not os.path.isfile(path)):
+        return set()
+
+    with open(path, "r", newline = "") as f:
+        rows = csv.DictReader(f, delimiter = "\t")
+        return set(jobKey(row) for row in rows)
+
+if (__name__ == "__main__"):
+
+    parser = argparse.ArgumentParser("Sweep NMF parameters.")
+    parser.add_argument("-x", "--excerpts",
+                        help = "Audio excerpts or spectrogram files. "
+                        + "(default = bassoon-solo)", nargs = '+',
+                        default = ["bassoon-solo"], dest = "excerpts")
+    parser.add_argument("-n", "--norms",
+                        help = "Spectrogram normalizations. "
+                        + "(default = none sum max rms)", nargs = '+',
+                        default = ["none", "sum", "max", "rms"], dest = "norms")
+    parser.add_argument("-c", "--costs",
+                        help = "Costs, 'frobenius', 'kld' or 'beta'. "
+                        + "(default = frobenius)", nargs = '+',
+                        type = str.lower, choices = COSTS,
+                        default = ["frobenius"], dest = "costs")
+    parser.add_argument("-b", "--betas",
+                        help = "Beta values of the 'beta' cost. "
+                        + "(default = 0.5)", nargs = '+', type = float,
+                        default = [0.5], dest = "betas")
+    parser.add_argument("-k", "--ranks",
+                        help = "Factorization ranks. (default = 1)",
+                        nargs = '+', type = int, default = [1], dest = "ranks")
+    parser.add_argument("-i", "--iterations",
+                        help = "Numbers of iterations. (default = 200)",
+                        nargs = '+', type = int, default = [200],
+                        dest = "iterations")
+    parser.add_argument("-j", "--jobs",
+                        help = "The number of worker processes. "
+                        + "(default = number of CPUs)",
+                        type = int, default = os.cpu_count(), dest = "jobs")
+    parser.add_argument("-d",
+                        help = "The results table. (default = %s)"
+                        % SWEEP_PATH,
+                        type = str, default = SWEEP_PATH, dest = "saveAs")
+    args = parser.parse_args()
+
+    # Calculate or load each spectrogram once.
+    spectrograms = {}
+    for excerpt in args.excerpts:
+        path = findFile(excerpt, [SPECTROGRAM_PATH])
+        if (path is None):
+            audioPath = findFile(excerpt, [AUDIO_PATH], ".wav")
+            if (audioPath is None):
+                print ("Could not load %s!" % excerpt)
+                raise SystemExit()
+            path = cacheFile(audioSpectrogram, [audioPath])
+        spectrograms[excerpt] = path
+
+    # The beta only matters for the beta cost.
+    costs = []
+    for cost in args.costs:
+        if (cost == "beta"):
+            costs += [("beta", beta) for beta in args.betas]
+        else:
+            costs += [(cost, costBeta(cost, None))]
+
+    done = readTable(args.saveAs)
+    jobs = []
+    numDone = 0
+    for excerpt, norm, (cost, beta), rank, iterations in itertools.product(
+            args.excerpts, args.norms, costs, args.ranks, args.iterations):
+        job = {"excerpt": excerpt, "norm": norm.lower(), "cost": cost,
+               "beta": beta, "rank": rank, "iterations": iterations,
+               "spectrogram": spectrograms[excerpt]}
+        if (jobKey(job) in done):
+            numDone += 1
+        else:
+            jobs += [job]
+
+    print ("Running %d jobs, %d already done." % (len(jobs), numDone))
+
+    createDir(args.saveAs)
+    newTable = not os.path.isfile(args.saveAs)
+    with open(args.saveAs, "a", newline = "") as f:
+        writer = csv.DictWriter(f, COLUMNS, delimiter = "\t")
+        if (newTable):
+            writer.writeheader()
+
+        with ProcessPoolExecutor(max_workers = args.jobs) as executor:
+            futures = [executor.submit(runJob, job) for job in jobs]
+            for future in as_completed(futures):
+                result = future.result()
+                writer.writerow(result)
+                f.flush()
+                print ("\t".join("%.4g" % result[column]
+                                 if (isinstance(result[column], float))
+                                 else str(result[column])
+                                 for column in COLUMNS))
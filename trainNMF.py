@@ -6,22 +6,78 @@ Visualize NMF transcriptions.
 import argparse
 import librosa
 import numpy as np
+import os
 
+from concurrent.futures import ProcessPoolExecutor
+
+from lib.CQT import CQTkernel
 from lib.CQT import CQTspectrogram
 from lib.NMF import NMF
-from lib.normalize import maxNormalize
-from lib.normalize import RMSnormalize
-from lib.normalize import sumNormalize
+from lib.NMF import onlineNMF
+from lib.normalize import getNormalization
 from lib.spectrogram import magnitudeSpectrogram
 from lib.utils import createDir
+from lib.utils import findFile
 
 NMF_DICTIONARY_PATH = "data/dictionaries/"
 INSTRUMENT_INFO_PATH = "data/paths/"
+SPECTROGRAM_PATH = "data/spectrograms/"
+
+def noteRange(lines):
+    """
+    Return the range of MIDI notes in an instrument info file.
+
+    Keyword arguments:
+    lines -- the lines of the info file, each starting with a MIDI note.
+
+    Returns:
+    instrumentRange -- the lowest and highest note as a tuple.
+    """
+
+    minNote = -1
+    maxNote = 0
+    for line in lines:
+        midi = int(line.split()[0])
+        if (minNote == -1 or midi < minNote):
+            minNote = midi
+        elif (midi > maxNote):
+            maxNote = midi
+
+    return (minNote, maxNote)
+
+def trainNote(notePath, Fs = 44100, cqt = False, normalization = None,
+              **kwargs):
+    """
+    Train the dictionary atom of a single note sample.
+
+    Keyword arguments:
+    notePath -- the note sample path.
+    Fs -- the sample rate. (default = 44100)
+    cqt -- whether to use CQT instead of STFT. (default = False)
+    normalization -- the spectrogram normalization function.
+        (default = None)
+
+    Returns:
+    w -- the note's dictionary atom.
+    """
+
+    x, Fs = librosa.load(notePath, sr = Fs, mono = True)
+    if (cqt):
+        S = CQTspectrogram(x, Fs, **kwargs)
+    else:
+        S = magnitudeSpectrogram(x, Fs, **kwargs)
+
+    if (not normalization is None):
+        S = normalization(S, axis = 1)
+
+    h, w = NMF(S, k = 1, **kwargs)
+
+    return w.flatten()
 
 def trainDictionary(instrument, instrumentRange = None, infoFile = None,
                     cqt = False, dictionaryPath = None, normalization = None,
                     Fs = 44100, fftSize = 2048, numOctaves = 8, octaveBins = 60,
-                    **kwargs):
+                    numWorkers = None, **kwargs):
     """
     Train an instrument model with NMF.
 
@@ -30,7 +86,8 @@ def trainDictionary(instrument, instrumentRange = None, infoFile = None,
     instrumentRange -- the range of MIDI notes to cover as a tuple.
     infoFile -- the path to a textfile containg instrument note paths.
         (default = None)
-    cqt -- whether to use CQT instead of STFT. (default = False)
+    cqt -- whether to use CQT instead of STFT. CQT dictionaries are saved
+        as <instrument>_CQT.npy. (default = False)
     dictionaryPath -- path to save . (default = None)
     normalization -- the spectrogram normalization function.
         (default = None)
@@ -38,6 +95,9 @@ def trainDictionary(instrument, instrumentRange = None, infoFile = None,
     fftSize -- the number of FFT bins. (default =2048)
     numOctaves -- the number of CQT octaves. (default = 8)
     octaveBins -- the number of bins per CQT octavee. (default = 60)
+    numWorkers -- the number of worker processes. Notes are trained in
+        parallel and the result does not depend on the number of workers.
+        (default = None, the number of CPUs)
     """
 
     kwargs.setdefault("fftSize", fftSize)
@@ -51,25 +111,22 @@ def trainDictionary(instrument, instrumentRange = None, infoFile = None,
         lines = f.readlines()
 
     if (instrumentRange is None):
-        minNote = -1
-        maxNote = 0
-        for line in lines:
-            midi = int(line.split()[0])
-            if (minNote == -1 or midi < minNote):
-                minNote = midi
-            elif (midi > maxNote):
-                maxNote = midi
-        instrumentRange = (minNote, maxNote)
+        instrumentRange = noteRange(lines)
 
     numNotes = instrumentRange[1] - instrumentRange[0] + 1
 
     if (cqt):
         numBins = octaveBins*numOctaves
+
+        # Calculate the CQT kernel once, before the workers are forked.
+        CQTkernel(Fs, kwargs.get("fMin", 27.5), numOctaves, octaveBins)
     else:
         numBins = 1 + fftSize//2
 
     W = np.zeros((numNotes, numBins))
 
+    notes = []
+    notePaths = []
     for line in lines:
         line = line.split()
         i = int(line[0]) - instrumentRange[0]
@@ -77,28 +134,69 @@ def trainDictionary(instrument, instrumentRange = None, infoFile = None,
         if (i < 0 or i >= numNotes):
             continue
 
-        notePath = line[1]
+        notes += [i]
+        notePaths += [line[1]]
 
-        x, Fs = librosa.load(notePath, sr = Fs, mono = True)
-        if (cqt):
-            S = CQTspectrogram(x, Fs, **kwargs)
-        else:
-            S = magnitudeSpectrogram(x, Fs, **kwargs)
+    if (numWorkers is None):
+        numWorkers = os.cpu_count()
 
-        if (not normalization is None):
-            S = normalization(S, axis = 1)
-
-        h, w = NMF(S, k = 1, **kwargs)
-        W[i] = w.flatten()
+    # Results are collected in file order, so later samples of a note
+    # overwrite earlier ones as when training sequentially.
+    with ProcessPoolExecutor(max_workers = numWorkers) as executor:
+        futures = [executor.submit(trainNote, notePath, Fs, cqt,
+                                   normalization, **kwargs)
+                   for notePath in notePaths]
+        for i, future in zip(notes, futures):
+            W[i] = future.result()
 
     if (dictionaryPath is None):
         dictionaryPath = NMF_DICTIONARY_PATH
 
-    path = dictionaryPath + instrument + ".npy"
+    path = dictionaryPath + instrument + ("_CQT.npy" if cqt else ".npy")
 
     createDir(path)
     np.save(path, W.T)
 
+def trainOnline(instrument, spectrogramPaths, rank = None, infoFile = None,
+                dictionaryPath = None, norm = "max", **kwargs):
+    """
+    Learn an instrument dictionary from spectrogram files with online NMF.
+
+    The spectrograms are memory mapped and streamed in batches, so the
+    corpus can be larger than memory. The learned atoms are not ordered by
+    note, so the dictionary is saved as <instrument>_online.npy.
+
+    Keyword arguments:
+    instrument -- the instrument name.
+    spectrogramPaths -- the spectrogram files.
+    rank -- the number of dictionary atoms. (default = None, the number of
+        notes in the instrument's range)
+    infoFile -- the path to a textfile containg instrument note paths,
+        used for the default rank. (default = None)
+    dictionaryPath -- path to save . (default = None)
+    norm -- the spectrogram normalization. (default = "max")
+
+    Keyword arguments are passed to onlineNMF.
+    """
+
+    if (rank is None):
+        if (infoFile is None):
+            infoFile = INSTRUMENT_INFO_PATH + instrument + ".txt"
+        with open(infoFile, "r") as f:
+            minNote, maxNote = noteRange(f.readlines())
+        rank = maxNote - minNote + 1
+
+    sources = [np.load(path, mmap_mode = "r") for path in spectrogramPaths]
+    W = onlineNMF(sources, k = rank, norm = norm, **kwargs)
+
+    if (dictionaryPath is None):
+        dictionaryPath = NMF_DICTIONARY_PATH
+
+    path = dictionaryPath + instrument + "_online.npy"
+
+    createDir(path)
+    np.save(path, W)
+
 if (__name__ == "__main__"):
 
     parser = argparse.ArgumentParser("Compute an NMF dictionary.")
@@ -115,17 +213,60 @@ if (__name__ == "__main__"):
     parser.add_argument("-d",
                         help = "The destination file. (default = None)",
                         type = str, default = None, dest = "saveAs")
+    parser.add_argument("-j", "--jobs",
+                        help = "The number of worker processes. "
+                        + "(default = number of CPUs)",
+                        type = int, default = None, dest = "jobs")
+    parser.add_argument("--online",
+                        help = "Learn the dictionary from these spectrogram "
+                        + "files instead of note samples, streaming them in "
+                        + "batches, and save it as <instrument>_online.npy.",
+                        nargs = '+', default = None, dest = "online")
+    parser.add_argument("-k", "--rank",
+                        help = "The number of atoms learned online. "
+                        + "(default = the number of notes in the range)",
+                        type = int, default = None, dest = "rank")
+    parser.add_argument("--batch",
+                        help = "The number of frames per online batch. "
+                        + "(default = 1024)",
+                        type = int, default = 1024, dest = "batchSize")
+    parser.add_argument("--passes",
+                        help = "The number of online passes over the "
+                        + "spectrograms. (default = 1)",
+                        type = int, default = 1, dest = "passes")
+    parser.add_argument("--cqt",
+                        help = "Train a dictionary of CQT spectrograms with "
+                        + "480 bins instead of STFT spectrograms, saved as "
+                        + "<instrument>_CQT.npy.",
+                        default = False, action = "store_true")
     args = parser.parse_args()
 
+    if (not args.online is None and args.cqt):
+        print ("--cqt does not apply to --online, the dictionary has the "
+               + "spectrograms' bins!")
+        raise SystemExit()
+
+    if (not args.online is None):
+        paths = []
+        for name in args.online:
+            path = findFile(name, [SPECTROGRAM_PATH])
+            if (path is None):
+                print ("Could not load %s!" % name)
+                raise SystemExit()
+            paths += [path]
+
+        # STFT and CQT spectrograms cannot be learned from together.
+        sizes = set(np.load(path, mmap_mode = "r").shape[0] for path in paths)
+        if (len(sizes) > 1):
+            print ("The spectrograms have different numbers of bins (%s)!"
+                   % ", ".join(str(size) for size in sorted(sizes)))
+            raise SystemExit()
 
-    if (args.norm.lower() == "max"):
-        norm = maxNormalize
-    elif (args.norm.lower() == "rms"):
-        norm = RMSnormalize
-    elif (args.norm.lower() == "sum"):
-        norm = sumNormalize
+        trainOnline(args.instrument, paths, args.rank, args.info,
+                    args.saveAs, args.norm, batchSize = args.batchSize,
+                    passes = args.passes, verbose = True)
     else:
-        norm = None
+        norm = getNormalization(args.norm)
 
-    trainDictionary(args.insrument, normalization = norm,
-                    dictionaryPath = args.dest)
+        trainDictionary(args.instrument, cqt = args.cqt, normalization = norm,
+                        dictionaryPath = args.saveAs, numWorkers = args.jobs)
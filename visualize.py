@@ -8,6 +8,12 @@ import matplotlib.animation as animation
 import matplotlib.pyplot as plt
 import numpy as np
 
+from time import perf_counter
+
+from lib.export import exportAnimation
+from lib.utils import absMax
+from lib.utils import findFile
+
 NMF_PATH = "data/NMFs/"
 SPECTROGRAM_PATH = "data/spectrograms/"
 TRUTH_PATH = "data/truths/"
@@ -25,6 +31,23 @@ if (__name__ == "__main__"):
                         help = "The display time for each frame in ms. "
                         + "(default = 10)",
                         type = int, default = 10, dest = "interval")
+    parser.add_argument("-r", "--realtime",
+                        help = "Show the frame at the current playback time, "
+                        + "skipping frames that cannot be drawn in time.",
+                        default = False, action = "store_true")
+    parser.add_argument("--fps",
+                        help = "The display rate in real time mode, or the "
+                        + "export frame rate. (default = 60)",
+                        type = float, default = 60, dest = "fps")
+    parser.add_argument("-e", "--export",
+                        help = "Render to a PNG sequence directory, a .gif "
+                        + "or a video file instead of showing the "
+                        + "animation. The frame rate is given by --fps.",
+                        type = str, default = None, dest = "export")
+    parser.add_argument("-j", "--jobs",
+                        help = "The number of export processes. "
+                        + "(default = number of CPUs)",
+                        type = int, default = None, dest = "jobs")
     parser.add_argument("-m", "--minNote",
                         help = "MIDI number of the lowest note bin."
                         + "(default = 0)",
@@ -34,85 +57,60 @@ if (__name__ == "__main__"):
     hopLen = 10
 
     if (len(args.spectrograms) > len(args.labels)):
-        labels += [""]*(len(args.spectrograms) - len(args.labels))
+        args.labels += [""]*(len(args.spectrograms) - len(args.labels))
 
-    plots = []
+    # Arrays are memory mapped and only the displayed frame is read and
+    # scaled.
+    paths = []
     for path in args.spectrograms:
-        while (True):
-            try:
-                S = np.load(path)
-                break
-            except:
-                pass
-
-            try:
-                S = np.load(path + ".npy")
-                break
-            except:
-                pass
-
-            try:
-                S = np.load(NMF_PATH + path)
-                break
-            except:
-                pass
-
-            try:
-                S = np.load(NMF_PATH + path + ".npy")
-                break
-            except:
-                pass
-
-            try:
-                S = np.load(SPECTROGRAM_PATH + path)
-                break
-            except:
-                pass
-
-            try:
-                S = np.load(SPECTROGRAM_PATH + path + ".npy")
-                break
-            except:
-                pass
-
-            try:
-                S = np.load(TRUTH_PATH + path)
-                break
-            except:
-                pass
-
-            try:
-                S = np.load(TRUTH_PATH + path + ".npy")
-                break
-            except:
-                pass
-
+        found = findFile(path, [NMF_PATH, SPECTROGRAM_PATH, TRUTH_PATH])
+        if (found is None):
             print ("Could not load %s!" % path)
             raise SystemExit()
-
-        plots += [S.T/np.max(abs(S))]
+        paths += [found]
+
+    if (not args.export is None):
+        numNotes = np.load(paths[0], mmap_mode = "r").shape[0]
+        try:
+            exportAnimation(paths, args.export, fps = args.fps,
+                            hopLen = hopLen, numWorkers = args.jobs,
+                            labels = args.labels,
+                            x = np.arange(0, numNotes) + args.minNote,
+                            xlabel = "Note (MIDI)")
+        except ValueError as e:
+            print (e)
+        raise SystemExit()
+
+    plots = [np.load(path, mmap_mode = "r") for path in paths]
+    scales = [absMax(S) for S in plots]
     numComp = len(plots)
 
+    def frame(j, i):
+        return plots[j][:, i]/scales[j] + j
+
     # Animate NMFs.
-    numFrames, numNotes = plots[0].shape
+    numNotes, numFrames = plots[0].shape
 
     toAnimate = []
 
     fig, ax = plt.subplots()
     k = np.arange(0, numNotes) + args.minNote
     for i in range(numComp):
-        line, = ax.plot(k, plots[i][0] + i, label = args.labels[i])
+        line, = ax.plot(k, frame(i, 0), label = args.labels[i])
         toAnimate += [line]
     time = ax.text(args.minNote, numComp, "t = %.3g s" % 0.0)
+    toAnimate += [time]
+
+    # The legend is static, so it is drawn once with the blitting
+    # background instead of on every frame.
     legend = ax.legend(loc = 1)
-    toAnimate += [time, legend]
     ax.set_ylim(-1, numComp + 1)
     ax.set_yticklabels([])
     ax.set_xlabel("Note (MIDI)")
 
     def animate(i):
         for j in range(numComp):
-            toAnimate[j].set_ydata(plots[j][i] + j)
+            toAnimate[j].set_ydata(frame(j, i))
         time.set_text("t = %.3g s" % (i*hopLen/1000))
         return toAnimate
 
@@ -120,10 +118,25 @@ if (__name__ == "__main__"):
         for j in range(numComp):
             toAnimate[j].set_ydata(np.ma.array(k, mask=True))
         time.set_text("")
-        return (line, time)
+        return toAnimate
+
+    if (args.realtime):
+
+        # Schedule by wall-clock time, so frames that are late are skipped
+        # and the displayed time stays in sync with playback.
+        def frames():
+            start = perf_counter()
+            while (True):
+                t = perf_counter() - start
+                yield int(t*1000/hopLen) % numFrames
+
+        interval = 1000/args.fps
+    else:
+        frames = np.arange(0, numFrames)
+        interval = args.interval
 
-    ani = animation.FuncAnimation(fig, animate, np.arange(0, numFrames),
-                                  init_func = init, interval = args.interval,
-                                  blit = True, repeat = True)
+    ani = animation.FuncAnimation(fig, animate, frames, init_func = init,
+                                  interval = interval, blit = True,
+                                  repeat = True, cache_frame_data = False)
 
     plt.show()
@@ -3,34 +3,52 @@
 Visualize NMF transcriptions.
 """
 
-import librosa
+import argparse
 import matplotlib.animation as animation
 import matplotlib.pyplot as plt
 import numpy as np
 
-from lib.spectrogram import magnitudeSpectrogram
-from lib.utils import createDir
+from lib.cache import cacheFile
+from lib.export import exportAnimation
+from lib.spectrogram import audioSpectrogram
 
 AUDIO_PATH = "data/audio/"
-SPECTROGRAM_PATH = "data/spectrograms/"
 
 if (__name__ == "__main__"):
 
+    parser = argparse.ArgumentParser("Visualize a spectrogram.")
+    parser.add_argument("-e", "--export",
+                        help = "Render to a PNG sequence directory, a .gif "
+                        + "or a video file instead of showing the "
+                        + "animation. (default = None)",
+                        type = str, default = None, dest = "export")
+    parser.add_argument("--fps",
+                        help = "The export frame rate. (default = 25)",
+                        type = float, default = 25, dest = "fps")
+    parser.add_argument("-j", "--jobs",
+                        help = "The number of export processes. "
+                        + "(default = number of CPUs)",
+                        type = int, default = None, dest = "jobs")
+    args = parser.parse_args()
+
     excerpt = "bassoon-solo"
     hopLen = 10   # ms
     Fs = 44100
 
-    try:
-        print ("Loading spectrogram.")
-        S = np.load(SPECTROGRAM_PATH + excerpt + ".npy")
-    except:
-        print ("Spectrogram not found. Calcualting from audio.")
-        path = AUDIO_PATH + excerpt + ".wav"
-        x, Fs = librosa.load(path, sr = Fs, mono = True)
-        S = magnitudeSpectrogram(x, Fs)
-        path = SPECTROGRAM_PATH + excerpt + ".npy"
-        createDir(path)
-        np.save(path, S)
+    print ("Loading spectrogram.")
+    path = AUDIO_PATH + excerpt + ".wav"
+    path = cacheFile(audioSpectrogram, [path], Fs = Fs, hopLen = hopLen)
+
+    if (not args.export is None):
+        try:
+            exportAnimation([path], args.export, fps = args.fps,
+                            hopLen = hopLen, numWorkers = args.jobs,
+                            offset = False, xlabel = "Frequency bin")
+        except ValueError as e:
+            print (e)
+        raise SystemExit()
+
+    S = np.load(path, mmap_mode = "r")
 
     # Animate spectrogram.
     numBins, numFrames = S.shape